@@ -0,0 +1,174 @@
+"""
+String interning for repetitive fields
+
+strings.py shows that sys.intern makes equal strings share one object. Data
+loaders usually do not: reading the unemployment CSV creates a new 'Area'
+string for each of its 73515 rows, although there are only 219 different
+areas. An InternPool hands out one shared object per distinct value:
+
+    pool = InternPool()
+    rows = read_csv_interned(path, fields=['Area', 'Year', 'Month'], pool=pool)
+    print(pool.report())
+
+Besides the memory, equal interned values are the same object, so filters
+and group-bys can compare with `is` (or let dict lookups hit their identity
+fast path) instead of comparing the characters.
+"""
+import csv
+import random
+import sys
+
+
+class InternPool:
+    """
+    Shared pool of strings for low cardinality fields
+
+    Strings go through sys.intern, so pools of different loaders (and
+    Student objects, see tasks/OO-exercises/student_management.py) share
+    the same objects. The pool only adds bookkeeping: how often it was asked,
+    how many distinct values it saw and how many bytes the duplicates would
+    have cost.
+    """
+    def __init__(self):
+        self.lookups = 0
+        self.bytes_saved = 0
+        self._seen = set()
+
+    def intern(self, value):
+        """Return the shared object equal to value"""
+        self.lookups += 1
+        shared = sys.intern(value)
+        if shared is not value:
+            # the caller drops its copy and keeps the shared one
+            self.bytes_saved += sys.getsizeof(value)
+        self._seen.add(shared)
+        return shared
+
+    __call__ = intern
+
+    def intern_fields(self, record, fields):
+        """Intern the given fields of a dict in place and return it"""
+        for field in fields:
+            value = record.get(field)
+            if isinstance(value, str):
+                record[field] = self.intern(value)
+        return record
+
+    @property
+    def distinct(self):
+        return len(self._seen)
+
+    def report(self):
+        return (f"{self.lookups} lookups, {self.distinct} distinct values, "
+                f"{self.bytes_saved / 1e6:.2f} MB of duplicate strings saved")
+
+
+# pool shared by the loaders of this module
+default_pool = InternPool()
+
+
+def read_csv_interned(path, fields, pool=None, **reader_kwargs):
+    """
+    Read a CSV file into a list of dicts, interning the given fields
+
+    Header names are stripped, the unemployment CSV pads its last column
+    name with blanks.
+    """
+    pool = pool or default_pool
+    with open(path, newline='') as f:
+        reader = csv.reader(f, **reader_kwargs)
+        header = [pool.intern(name.strip()) for name in next(reader)]
+        intern_at = [i for i, name in enumerate(header) if name in fields]
+        rows = []
+        for values in reader:
+            for i in intern_at:
+                values[i] = pool.intern(values[i])
+            rows.append(dict(zip(header, values)))
+    return rows
+
+
+names = ["Albert", "John", "Richard", "Henry", "William"]
+surnames = ["Goodman", "Black", "White", "Green", "Joneson"]
+salaries = [500*random.randint(10, 30) for _ in range(10)]
+
+
+def generate_random_person(names, surnames, salaries):
+    # picked from the lists, the names are shared already; names coming from
+    # a parser are interned by read_csv_interned instead
+    return {"name": random.choice(names),
+            "surname": random.choice(surnames),
+            "salary": random.choice(salaries)}
+
+
+def generate_people(k):
+    """generate_people of the Dask notebook; all people share the name strings of the lists"""
+    return [generate_random_person(names, surnames, salaries) for _ in range(k)]
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import time
+    import tracemalloc
+
+    def benchmark(function, function_name, repeat=20):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format((end - start) / repeat, function_name))
+        return result
+
+    def measure(function):
+        tracemalloc.start()
+        result = function()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, size
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '11_data_visualization',
+                        'data', 'Local_Area_Unemployment_Statistics__Beginning_1976.csv')
+    fields = ['Area', 'Year', 'Month', 'Unemployment Rate']
+
+    def read_plain():
+        with open(path, newline='') as f:
+            reader = csv.reader(f)
+            header = [name.strip() for name in next(reader)]
+            return [dict(zip(header, values)) for values in reader]
+
+    plain, plain_size = measure(read_plain)
+    pool = InternPool()
+    interned, interned_size = measure(lambda: read_csv_interned(path, fields, pool))
+    print("rows: {0}, plain {1:.1f} MB, interned {2:.1f} MB".format(
+        len(plain), plain_size / 1e6, interned_size / 1e6))
+    print(pool.report())
+
+    # filtering: equal strings are compared character by character, interned
+    # ones by identity
+    target = sys.intern("Bronx County")
+    benchmark(lambda: [r for r in plain if r['Area'] == target], "filter with ==, plain")
+    benchmark(lambda: [r for r in interned if r['Area'] is target], "filter with is, interned")
+
+    def group_rates(rows):
+        groups = {}
+        for r in rows:
+            groups.setdefault(r['Area'], []).append(r['Unemployment Rate'])
+        return groups
+
+    benchmark(lambda: group_rates(plain), "group by Area, plain")
+    benchmark(lambda: group_rates(interned), "group by Area, interned")
+
+    # people written to disk and read back: every name is a new string again
+    with tempfile.TemporaryDirectory() as tmp:
+        people_path = os.path.join(tmp, 'people.csv')
+        with open(people_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=["name", "surname", "salary"])
+            writer.writeheader()
+            writer.writerows(generate_people(200000))
+        with open(people_path, newline='') as f:
+            _, plain_size = measure(lambda: list(csv.DictReader(f)))
+        people_pool = InternPool()
+        _, interned_size = measure(lambda: read_csv_interned(people_path, ["name", "surname"],
+                                                             people_pool))
+    print("200000 people read back: plain {0:.1f} MB, interned {1:.1f} MB".format(
+        plain_size / 1e6, interned_size / 1e6))
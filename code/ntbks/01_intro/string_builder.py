@@ -0,0 +1,125 @@
+"""
+Building large strings
+
+strings_2.py shows that `d1 += ' science'` creates a new string object every
+time: strings are immutable. Assembling a large text piece by piece with +=
+copies everything built so far on every step, which is quadratic.
+
+CPython hides this in the simplest case: when the string on the left has no
+other reference (a local variable in a loop, like res in myConcatenator) it
+resizes the string in place. As soon as the text lives in an attribute, a
+list or a dict, or another name refers to it, every += copies again. The
+benchmark below shows both.
+
+Collecting the pieces in a list and joining them once is linear in every case:
+
+    report = StringBuilder()
+    for student in students:
+        report.appendline(student.display_info())
+    text = report.build()       # or report.write_to(f) without building it
+"""
+import io
+
+
+def concat(*args):
+    """myConcatenator / myBigMathFunction of Decorators.ipynb without +="""
+    return ''.join(args)
+
+
+class StringBuilder:
+    """Collects string pieces and joins them once"""
+    __slots__ = ('_parts', '_length')
+
+    def __init__(self, *parts):
+        self._parts = list(parts)
+        self._length = sum(map(len, parts))
+
+    def append(self, text):
+        self._parts.append(text)
+        self._length += len(text)
+        return self
+
+    def appendline(self, text=''):
+        return self.append(text).append('\n')
+
+    def extend(self, texts):
+        for text in texts:
+            self.append(text)
+        return self
+
+    # builder += 'text' appends in place instead of creating a new object
+    def __iadd__(self, text):
+        return self.append(text)
+
+    def __len__(self):
+        """Number of characters built so far"""
+        return self._length
+
+    def build(self):
+        """Join the pieces; they are kept as one piece for further appends"""
+        text = ''.join(self._parts)
+        self._parts = [text]
+        return text
+
+    __str__ = build
+
+    def write_to(self, file):
+        """Write the pieces to a text file without joining them in memory"""
+        file.writelines(self._parts)
+        return self._length
+
+    def clear(self):
+        self._parts = []
+        self._length = 0
+
+
+def build_with_stringio(parts):
+    """The same with io.StringIO, which grows its buffer like a list"""
+    buffer = io.StringIO()
+    for part in parts:
+        buffer.write(part)
+    return buffer.getvalue()
+
+
+if __name__ == '__main__':
+    import time
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    class Report:
+        pass
+
+    for n in (10000, 40000):
+        lines = [f"Student: student {i}\nProgram: Computer Science\nGPA: 3.00\n"
+                 for i in range(n)]
+        print(f"\n{n} lines")
+
+        def plus_local():
+            res = ''
+            for line in lines:
+                res += line
+            return res
+
+        def plus_attribute():
+            report = Report()
+            report.text = ''
+            for line in lines:
+                report.text += line
+            return report.text
+
+        def builder():
+            report = StringBuilder()
+            for line in lines:
+                report += line
+            return report.build()
+
+        expected = benchmark(plus_local, "+= on a local (CPython resizes in place)")
+        assert benchmark(plus_attribute, "+= on an attribute (copies every time)") == expected
+        assert benchmark(builder, "StringBuilder") == expected
+        assert benchmark(lambda: build_with_stringio(lines), "io.StringIO") == expected
+        assert benchmark(lambda: concat(*lines), "concat / ''.join") == expected
@@ -0,0 +1,271 @@
+"""
+Memoization decorator
+
+Builds on the decorator patterns of Decorators.ipynb: the wrapper remembers
+results of earlier calls, so e.g. the recursive fibonacci of the functional
+programming notebook becomes linear instead of exponential.
+
+    @memoize(maxsize=1024, ttl=60)
+    def fibonacci(n):
+        ...
+
+Features:
+- size bounded LRU eviction and an optional time to live per entry
+- per argument key functions, e.g. key_funcs={'df': id}
+- unhashable arguments (lists, dicts, sets, NumPy arrays) are turned into
+  hashable keys
+- hit / miss / eviction counters via fibonacci.cache_info()
+- thread safe
+"""
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+
+
+class CacheInfo:
+    """Statistics of a memoized function"""
+    def __init__(self, hits, misses, evictions, expired, size, maxsize):
+        self.hits = hits
+        self.misses = misses
+        self.evictions = evictions
+        self.expired = expired
+        self.size = size
+        self.maxsize = maxsize
+
+    @property
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+    def __repr__(self):
+        return (f"CacheInfo(hits={self.hits}, misses={self.misses}, "
+                f"evictions={self.evictions}, expired={self.expired}, "
+                f"size={self.size}, maxsize={self.maxsize}, "
+                f"hit_rate={self.hit_rate:.2%})")
+
+
+def make_hashable(value):
+    """
+    Turn a (possibly unhashable) argument into a hashable key
+
+    Containers are converted recursively and tagged with their type, so
+    [1, 2] and (1, 2) do not share a cache entry. Arrays are keyed by dtype,
+    shape and a digest of their bytes.
+    """
+    try:
+        hash(value)
+    except TypeError:
+        pass
+    else:
+        # tuples may be hashable but still need the type tag
+        if not isinstance(value, tuple):
+            return value
+
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(make_hashable(v) for v in value)
+    if isinstance(value, dict):
+        # a frozenset, not a sorted tuple: keys of different types do not compare
+        return ('dict', frozenset((make_hashable(k), make_hashable(v))
+                                  for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return ('set', frozenset(make_hashable(v) for v in value))
+    if hasattr(value, 'tobytes') and hasattr(value, 'dtype'):
+        if value.dtype.kind == 'O':
+            # the buffer holds pointers, equal arrays would differ
+            return ('ndarray', 'object', getattr(value, 'shape', ()), make_hashable(value.tolist()))
+        # NumPy arrays (and scalars): hash the raw buffer instead of the object
+        digest = hashlib.blake2b(value.tobytes(), digest_size=16).hexdigest()
+        return ('ndarray', str(value.dtype), getattr(value, 'shape', ()), digest)
+    if hasattr(value, '__dict__'):
+        return (type(value).__name__, make_hashable(vars(value)))
+    raise TypeError(f"cannot build a cache key for {type(value).__name__!r}")
+
+
+def memoize(func=None, *, maxsize=128, ttl=None, key_funcs=None, typed=False):
+    """
+    Cache the results of func
+
+    maxsize   -- maximum number of cached results, None for unbounded;
+                 the least recently used entry is evicted first
+    ttl       -- seconds a result stays valid, None for forever
+    key_funcs -- dict mapping argument names to functions computing the
+                 cache key for that argument
+    typed     -- cache 1 and 1.0 separately
+
+    Can be used as @memoize or @memoize(maxsize=...).
+    """
+    if func is None:
+        return lambda f: memoize(f, maxsize=maxsize, ttl=ttl,
+                                 key_funcs=key_funcs, typed=typed)
+
+    key_funcs = key_funcs or {}
+    # binding the arguments is only needed for per argument key functions
+    signature = inspect.signature(func) if key_funcs else None
+    cache = OrderedDict()   # key -> (result, expires_at)
+    expiry = deque()        # (expires_at, key) in insertion order, with ttl
+    lock = threading.RLock()
+    stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+    kwd_mark = object()
+
+    def make_key(args, kwargs):
+        if signature is not None:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            parts = []
+            for name, value in bound.arguments.items():
+                key_func = key_funcs.get(name)
+                part = key_func(value) if key_func else make_hashable(value)
+                parts.append((name, part, type(value)) if typed else (name, part))
+            return tuple(parts)
+        key = tuple(make_hashable(a) for a in args)
+        if kwargs:
+            names = sorted(kwargs)
+            key += (kwd_mark,) + tuple((k, make_hashable(kwargs[k])) for k in names)
+        if typed:
+            key += tuple(type(a) for a in args)
+            if kwargs:
+                key += tuple(type(kwargs[k]) for k in names)
+        return key
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = make_key(args, kwargs)
+        with lock:
+            entry = cache.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    cache.move_to_end(key)
+                    stats['hits'] += 1
+                    return result
+                del cache[key]
+                stats['expired'] += 1
+            stats['misses'] += 1
+
+        # call without holding the lock: recursive functions call the wrapper
+        # again and other threads should not wait for a slow computation
+        result = func(*args, **kwargs)
+
+        with lock:
+            now = time.monotonic()
+            expires_at = None if ttl is None else now + ttl
+            cache[key] = (result, expires_at)
+            cache.move_to_end(key)
+            if ttl is not None:
+                # drop what has expired, also entries never asked for again
+                expiry.append((expires_at, key))
+                while expiry and expiry[0][0] <= now:
+                    old_expires_at, old_key = expiry.popleft()
+                    entry = cache.get(old_key)
+                    if entry is not None and entry[1] == old_expires_at:
+                        del cache[old_key]
+                        stats['expired'] += 1
+            if maxsize is not None:
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+                    stats['evictions'] += 1
+        return result
+
+    def cache_info():
+        with lock:
+            return CacheInfo(size=len(cache), maxsize=maxsize, **stats)
+
+    def cache_clear():
+        with lock:
+            cache.clear()
+            expiry.clear()
+            for k in stats:
+                stats[k] = 0
+
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+
+if __name__ == '__main__':
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.6f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    def fibonacci(n):
+        if n <= 1:
+            return n
+        else:
+            return fibonacci(n-2) + fibonacci(n-1)
+
+    benchmark(lambda: fibonacci(25), "plain fibonacci(25)")
+
+    @memoize(maxsize=None)
+    def fibonacci(n):
+        if n <= 1:
+            return n
+        else:
+            return fibonacci(n-2) + fibonacci(n-1)
+
+    print(benchmark(lambda: fibonacci(300), "memoized fibonacci(300)"))
+    print(fibonacci.cache_info())
+
+    # unhashable arguments and small caches
+    @memoize(maxsize=2)
+    def total(values):
+        return sum(values)
+
+    for values in ([1, 2, 3], [1, 2, 3], [4, 5], [6], [1, 2, 3]):
+        total(values)
+    print(total.cache_info())
+
+    # per argument key functions: the verbose flag does not change the result
+    @memoize(key_funcs={'data': tuple, 'verbose': lambda v: None}, ttl=1.0)
+    def mean(data, verbose=False):
+        return sum(data) / len(data)
+
+    mean([1, 2, 3]), mean([1, 2, 3], verbose=True)
+    print(mean.cache_info())
+
+    # typed also applies to keyword arguments and with key functions
+    @memoize(typed=True)
+    def half(x):
+        return x / 2
+
+    half(x=1), half(x=1.0)
+    assert half.cache_info().misses == 2
+
+    @memoize(typed=True, key_funcs={'data': tuple})
+    def first(data, scale=1):
+        return data[0] * scale
+
+    first([1], scale=2), first([1], scale=2.0)
+    assert first.cache_info().misses == 2
+
+    # dicts with keys of different types
+    assert make_hashable({1: 'a', 'b': 2}) == make_hashable({'b': 2, 1: 'a'})
+
+    # expired entries are purged even if they are never looked up again
+    @memoize(maxsize=None, ttl=0.01)
+    def square(x):
+        return x * x
+
+    for x in range(100):
+        square(x)
+    time.sleep(0.02)
+    square(-1)
+    assert square.cache_info().size == 1
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is not None:
+        # object arrays are keyed by their values, not by their pointers
+        @memoize
+        def length(values):
+            return len(values)
+
+        length(np.array(['a', 'b'], dtype=object)), length(np.array(['a', 'b'], dtype=object))
+        assert length.cache_info().hits == 1
@@ -0,0 +1,328 @@
+"""
+Low overhead profiling decorators
+
+`timer` and `timer2` of Decorators.ipynb print twice per call and use
+time.time(), which costs more than the small functions they measure. The
+`profile` decorator below instead records every (sampled) call into an
+in-memory latency histogram:
+
+    @profile
+    def mathFunc2(a, b):
+        return a + b
+
+    @profile(sample_every=100)
+    async def fetch(url):
+        ...
+
+    report()        # sorted hot path report
+
+- perf_counter_ns timings collected in log-linear histograms giving count,
+  total and p50 / p99 latency (within about 6%)
+- every thread writes into its own histograms, so the hot path takes no lock;
+  they are merged when a report is made. The histograms of finished threads
+  are folded into one per function then, so short lived threads do not pile
+  up histograms
+- sample_every=n only times every n-th call
+- disable() turns all instrumentation off; a call still goes through the
+  wrapper, i.e. one more Python call with *args / **kwargs (a few hundred ns,
+  see the benchmark below). Remove the decorator from really hot functions
+"""
+import inspect
+import sys
+import threading
+from functools import wraps
+from time import perf_counter_ns
+
+_ENABLED = True
+
+# values below 2**(_SUB_BITS+1) get their own bucket, above that every power of
+# two is split into 2**_SUB_BITS buckets
+_SUB_BITS = 3
+_LINEAR = 1 << (_SUB_BITS + 1)
+_N_BUCKETS = _LINEAR + 64 * (1 << _SUB_BITS)
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_registry = []      # (thread, name, Histogram) for every live thread and function
+_retired = {}       # name -> Histogram of the threads which have finished
+_generation = 0     # incremented by reset(), threads then start new histograms
+_sampling = {}      # name -> sample_every
+
+
+def enable():
+    """Switch instrumentation on for all decorated functions"""
+    global _ENABLED
+    _ENABLED = True
+
+
+def disable():
+    """Switch instrumentation off, decorated functions run (almost) unmeasured"""
+    global _ENABLED
+    _ENABLED = False
+
+
+def is_enabled():
+    return _ENABLED
+
+
+def _bucket(ns):
+    if ns < _LINEAR:
+        return ns
+    exp = ns.bit_length() - _SUB_BITS - 1
+    return _LINEAR + (exp - 1) * (1 << _SUB_BITS) + ((ns >> exp) & ((1 << _SUB_BITS) - 1))
+
+
+def _bucket_value(index):
+    """Midpoint of the range of nanosecond values falling into bucket index"""
+    if index < _LINEAR:
+        return index
+    exp, sub = divmod(index - _LINEAR, 1 << _SUB_BITS)
+    exp += 1
+    low = ((1 << _SUB_BITS) + sub) << exp
+    return low + (1 << exp) // 2
+
+
+class Histogram:
+    """Latency histogram of one function, written by a single thread"""
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = [0] * _N_BUCKETS
+
+    def record(self, ns):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        self.buckets[_bucket(ns)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def percentile(self, q):
+        """Approximate q-th percentile (0 <= q <= 100) in nanoseconds"""
+        if not self.count:
+            return 0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(_bucket_value(index), self.max)
+        return self.max
+
+
+def _histogram(name):
+    """Histogram of the calling thread for name; registered on first use"""
+    try:
+        generation, hists = _local.hists
+    except AttributeError:
+        generation = None
+    if generation != _generation:
+        # first call of this thread, or reset() dropped its histograms
+        hists = {}
+        _local.hists = (_generation, hists)
+    hist = hists.get(name)
+    if hist is None:
+        hist = hists[name] = Histogram()
+        with _registry_lock:
+            _registry.append((threading.current_thread(), name, hist))
+    return hist
+
+
+def profile(func=None, *, name=None, sample_every=1):
+    """
+    Record the latency of func into a histogram
+
+    name         -- report name, defaults to module.qualname
+    sample_every -- time only every n-th call; counts and totals in the
+                    report are scaled back up by n
+    """
+    if func is None:
+        return lambda f: profile(f, name=name, sample_every=sample_every)
+
+    label = name or f"{func.__module__}.{func.__qualname__}"
+    calls = [0]
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return await func(*args, **kwargs)
+            if sample_every > 1:
+                calls[0] += 1
+                if calls[0] % sample_every:
+                    return await func(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _histogram(label).record(perf_counter_ns() - start)
+        async_wrapper.sample_every = sample_every
+        async_wrapper.profile_name = label
+        _sampling[label] = sample_every
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _ENABLED:
+            return func(*args, **kwargs)
+        if sample_every > 1:
+            # not atomic, under threads a few calls are sampled twice or not
+            # at all which is irrelevant for sampling
+            calls[0] += 1
+            if calls[0] % sample_every:
+                return func(*args, **kwargs)
+        start = perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _histogram(label).record(perf_counter_ns() - start)
+    wrapper.sample_every = sample_every
+    wrapper.profile_name = label
+    _sampling[label] = sample_every
+    return wrapper
+
+
+def snapshot():
+    """Merge the histograms of all threads, one Histogram per name"""
+    with _registry_lock:
+        alive = []
+        for thread, name, hist in _registry:
+            if thread.is_alive():
+                alive.append((thread, name, hist))
+            else:
+                # the thread can not record anymore, keep its timings only
+                _retired.setdefault(name, Histogram()).merge(hist)
+        _registry[:] = alive
+        entries = [(name, hist) for _, name, hist in alive] + list(_retired.items())
+        merged = {}
+        for name, hist in entries:
+            merged.setdefault(name, Histogram()).merge(hist)
+    return merged
+
+
+def reset():
+    """Forget all recorded timings"""
+    global _generation
+    # other threads may be recording right now: their histograms are not
+    # touched, only dropped; each thread starts fresh ones on its next call
+    with _registry_lock:
+        _generation += 1
+        _registry.clear()
+        _retired.clear()
+
+
+def report(sort_by='total', limit=None, file=None):
+    """
+    Print the hot path report, sorted descending by 'total', 'count',
+    'mean', 'p50', 'p99' or 'max'; timings in microseconds
+    """
+    file = file or sys.stdout
+    rows = []
+    for name, hist in snapshot().items():
+        if not hist.count:
+            continue
+        scale = _sampling.get(name, 1)
+        rows.append({
+            'name': name,
+            'count': hist.count * scale,
+            'total': hist.total * scale / 1e3,
+            'mean': hist.total / hist.count / 1e3,
+            'p50': hist.percentile(50) / 1e3,
+            'p99': hist.percentile(99) / 1e3,
+            'max': hist.max / 1e3,
+        })
+    rows.sort(key=lambda row: row[sort_by], reverse=True)
+    if limit is not None:
+        rows = rows[:limit]
+
+    print(f"{'function':<40} {'calls':>10} {'total us':>12} {'mean us':>10} "
+          f"{'p50 us':>10} {'p99 us':>10} {'max us':>10}", file=file)
+    for row in rows:
+        print(f"{row['name']:<40} {row['count']:>10} {row['total']:>12.1f} "
+              f"{row['mean']:>10.3f} {row['p50']:>10.3f} {row['p99']:>10.3f} "
+              f"{row['max']:>10.3f}", file=file)
+    return rows
+
+
+if __name__ == '__main__':
+    import asyncio
+    import time
+
+    def mathFunc(a, b):
+        return a + b
+
+    @profile
+    def mathFunc2(a, b):
+        return a + b
+
+    @profile(sample_every=10)
+    def myBigMathFunction(*args):
+        return sum(args)
+
+    @profile
+    async def fetch(delay):
+        await asyncio.sleep(delay)
+
+    def benchmark(function, function_name, n=1000000):
+        start = time.perf_counter()
+        for _ in range(n):
+            function(4, 5)
+        end = time.perf_counter()
+        print("{0:.1f} ns per call for {1}".format((end - start) / n * 1e9, function_name))
+
+    benchmark(mathFunc, "plain function")
+    benchmark(mathFunc2, "profiled function")
+    benchmark(myBigMathFunction, "profiled, every 10th call sampled")
+    disable()
+    benchmark(mathFunc2, "profiling disabled")
+    enable()
+
+    async def main():
+        await asyncio.gather(*(fetch(0.001 * i) for i in range(20)))
+    asyncio.run(main())
+
+    threads = [threading.Thread(target=benchmark, args=(mathFunc2, "thread", 100000))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print()
+    report()
+
+    # short lived threads: their histograms are folded, the registry stays small
+    calls = snapshot()[mathFunc2.profile_name].count
+    registered = len(_registry)
+    for _ in range(100):
+        t = threading.Thread(target=mathFunc2, args=(1, 2))
+        t.start()
+        t.join()
+    assert snapshot()[mathFunc2.profile_name].count == calls + 100
+    assert len(_registry) == registered
+
+    # reset while another thread keeps recording
+    stop = threading.Event()
+
+    def record():
+        while not stop.is_set():
+            mathFunc2(1, 2)
+    recorder = threading.Thread(target=record)
+    recorder.start()
+    time.sleep(0.05)
+    reset()
+    assert not _retired and all(name in snapshot() for _, name, _ in _registry)
+    time.sleep(0.05)
+    stop.set()
+    recorder.join()
+    assert snapshot()[mathFunc2.profile_name].count > 0
+    reset()
+    assert not snapshot()
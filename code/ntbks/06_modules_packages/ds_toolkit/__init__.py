@@ -0,0 +1,8 @@
+"""
+ds_toolkit: small helpers for everyday data science tasks
+
+Started in "Complex packages and testing.ipynb".
+"""
+from .io import read_file, write_file
+
+__all__ = ['read_file', 'write_file']
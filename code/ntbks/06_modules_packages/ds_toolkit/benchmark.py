@@ -0,0 +1,87 @@
+"""
+Read / write throughput and file size of ds_toolkit.io formats
+
+Run from code/ntbks/06_modules_packages (not as ds_toolkit/io.py, the module
+name would hide the io module of the standard library):
+
+    python -m ds_toolkit.benchmark
+
+Every bundled dataset is written and read back in every format whose
+dependencies are installed; the projected read loads the first column and
+the first tenth of the rows only.
+"""
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from .io import read_file, write_file
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '..', 'data')
+VIS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '11_data_visualization',
+                       'data')
+
+# (name, path, read_csv options)
+DATASETS = [
+    ('housing', os.path.join(DATA_DIR, 'ntbk_data', '04_data', 'housing.csv'), {}),
+    ('media', os.path.join(DATA_DIR, 'ntbk_data', '04_data', 'media.csv'), {}),
+    ('suicide_data', os.path.join(DATA_DIR, 'ntbk_data', '04_data', 'suicide_data.csv'), {}),
+    ('amazon', os.path.join(DATA_DIR, 'amazon', 'amazon.csv'), {'encoding': 'latin-1'}),
+    ('inpe_fires', os.path.join(DATA_DIR, 'amazon', 'inpe_amazon_fires_1999_2019.csv'), {}),
+    ('unemployment', os.path.join(VIS_DIR, 'Local_Area_Unemployment_Statistics__Beginning_1976.csv'), {}),
+]
+
+FORMATS = [('csv', '.csv'), ('hdf5', '.h5'), ('parquet', '.parquet'),
+           ('feather', '.feather'), ('npy', '.npy')]
+
+
+def timed(function, repeat=3):
+    """Best of repeat runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def load(path, options):
+    df = pd.read_csv(path, **options)
+    # some headers carry a byte order mark or blanks
+    df.columns = [str(name).strip().lstrip('\ufeff') for name in df.columns]
+    return df
+
+
+def run(datasets=DATASETS, formats=FORMATS, directory=None):
+    """One row per dataset and format: sizes in MB, throughputs in MB/s of in-memory data"""
+    rows = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for name, path, options in datasets:
+            if not os.path.isfile(path):
+                continue
+            df = load(path, options)
+            memory = df.memory_usage(deep=True).sum() / 1e6
+            column = [df.columns[0]]
+            part = (0, max(1, len(df) // 10))
+            for fmt, ext in formats:
+                filepath = os.path.join(tmp, name + ext)
+                try:
+                    write = timed(lambda: write_file(df, filepath))
+                    read = timed(lambda: read_file(filepath))
+                    projected = timed(lambda: read_file(filepath, columns=column, rows=part))
+                except (ImportError, TypeError, ValueError) as error:
+                    print(f"{name} {fmt}: skipped ({error})")
+                    continue
+                rows.append({'dataset': name, 'format': fmt, 'rows': len(df),
+                             'file MB': os.path.getsize(filepath) / 1e6,
+                             'write MB/s': memory / write, 'read MB/s': memory / read,
+                             'projected read ms': projected * 1e3})
+                os.remove(filepath)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    results = run()
+    with pd.option_context('display.width', 120, 'display.float_format', '{:.2f}'.format):
+        print(results.to_string(index=False))
@@ -0,0 +1,335 @@
+"""
+Reading and writing data files
+
+read_file / write_file infer the format from the file extension (or, for
+reading, from the first bytes of the file) and dispatch to a reader or
+writer registered for it:
+
+    write_file(test_df, 'data/06/testfile1.h5', key='test_df')
+    read_df = read_file('data/06/testfile1.h5')
+
+    # only load what is needed
+    read_file('big.parquet', columns=['A'], rows=(1000, 2000))
+
+Supported: HDF5, Parquet, Feather, NPY (memory mapped) and CSV, plus FITS
+when astropy is installed. Further formats can be added with
+register_reader / register_writer.
+
+Column projection (columns=[...]) and row ranges (rows=(start, stop)) are
+pushed down into the format where it supports them: HDF5 tables, Parquet row
+groups, memory mapped Feather and NPY files only read the requested part
+from disk.
+
+Only HDF5 stores the index of the DataFrame. The other formats store the
+columns, and read_file returns a default RangeIndex; call reset_index()
+before writing to keep the index as a column. Other extensions, e.g. .txt
+for CSV text, need format=...
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+_READERS = {}
+_WRITERS = {}
+_EXTENSIONS = {}
+
+# first bytes of the binary formats, used when the extension is unknown
+_MAGIC = (
+    (b'\x89HDF\r\n\x1a\n', 'hdf5'),
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'feather'),
+    (b'\x93NUMPY', 'npy'),
+    (b'SIMPLE  =', 'fits'),
+)
+
+
+def register_reader(fmt, extensions=()):
+    """
+    Decorator registering func(filepath, columns, start, stop, **kwargs) as
+    the reader for fmt; start / stop are None when all rows are wanted
+    """
+    def decorator(func):
+        _READERS[fmt] = func
+        for ext in extensions:
+            _EXTENSIONS[ext] = fmt
+        return func
+    return decorator
+
+
+def register_writer(fmt, extensions=()):
+    """Decorator registering func(df, filepath, **kwargs) as the writer for fmt"""
+    def decorator(func):
+        _WRITERS[fmt] = func
+        for ext in extensions:
+            _EXTENSIONS[ext] = fmt
+        return func
+    return decorator
+
+
+def formats():
+    """Names of the formats that can be read"""
+    return sorted(_READERS)
+
+
+def detect_format(filepath):
+    """Format of a file from its extension, for existing files also from its content"""
+    name = filepath.lower()
+    if name.endswith(('.gz', '.bz2', '.xz', '.zip')):
+        # compressed text formats, e.g. data.csv.gz
+        name = os.path.splitext(name)[0]
+    ext = os.path.splitext(name)[1]
+    if ext in _EXTENSIONS:
+        return _EXTENSIONS[ext]
+    if os.path.isfile(filepath):
+        with open(filepath, 'rb') as f:
+            head = f.read(16)
+        for magic, fmt in _MAGIC:
+            if head.startswith(magic):
+                return fmt
+    raise ValueError(f"can not infer the file format of {filepath!r}, pass format=...")
+
+
+def _row_range(rows):
+    if rows is None:
+        return None, None
+    if isinstance(rows, slice):
+        if rows.step not in (None, 1):
+            raise ValueError("row ranges can not have a step")
+        return rows.start, rows.stop
+    start, stop = rows
+    return start, stop
+
+
+def read_file(filepath, columns=None, rows=None, format=None, **kwargs):
+    """
+    Read a file into a DataFrame
+
+    columns -- list of columns to load, None for all
+    rows    -- (start, stop) or slice(start, stop) of the rows to load
+    format  -- overrides the format inferred from the file
+    kwargs  -- passed on to the reader (e.g. key=... for HDF5)
+    """
+    fmt = format or detect_format(filepath)
+    try:
+        reader = _READERS[fmt]
+    except KeyError:
+        raise ValueError(f"no reader for format {fmt!r}") from None
+    start, stop = _row_range(rows)
+    return reader(filepath, columns, start, stop, **kwargs)
+
+
+def write_file(df, filepath, format=None, **kwargs):
+    """
+    Write a DataFrame, the format is inferred from the file extension
+
+    The index is only written to HDF5 files, see the module docstring.
+    """
+    fmt = format or detect_format(filepath)
+    try:
+        writer = _WRITERS[fmt]
+    except KeyError:
+        raise ValueError(f"no writer for format {fmt!r}") from None
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return writer(df, filepath, **kwargs)
+
+
+def _select(df, columns, start, stop):
+    """Projection and row range for formats which can not push them down"""
+    if columns is not None:
+        df = df[list(columns)]
+    if start is not None or stop is not None:
+        df = df.iloc[start:stop]
+    return df
+
+
+def _require(module, fmt):
+    raise ImportError(f"reading and writing {fmt} files needs the {module} package")
+
+
+# -- HDF5 -------------------------------------------------------------------
+
+@register_writer('hdf5', extensions=('.h5', '.hdf5', '.hdf'))
+def write_hdf5(df, filepath, key='data', data_format='table', **kwargs):
+    # the table format allows reading column subsets and row ranges
+    df.to_hdf(filepath, key=key, format=data_format, **kwargs)
+
+
+@register_reader('hdf5', extensions=('.h5', '.hdf5', '.hdf'))
+def read_hdf5(filepath, columns=None, start=None, stop=None, key=None, **kwargs):
+    with pd.HDFStore(filepath, mode='r') as store:
+        if key is None:
+            keys = store.keys()
+            if len(keys) != 1:
+                raise ValueError(f"{filepath} holds {len(keys)} data sets, pass key=...")
+            key = keys[0]
+        if store.get_storer(key).is_table:
+            return store.select(key, columns=columns, start=start, stop=stop, **kwargs)
+        # fixed format: rows can be limited, columns only afterwards
+        return _select(store.select(key, start=start, stop=stop, **kwargs), columns, None, None)
+
+
+# -- Parquet ----------------------------------------------------------------
+
+@register_writer('parquet', extensions=('.parquet', '.pq'))
+def write_parquet(df, filepath, row_group_size=100000, **kwargs):
+    # smaller row groups make row range reads cheaper
+    df.to_parquet(filepath, index=False, row_group_size=row_group_size, **kwargs)
+
+
+@register_reader('parquet', extensions=('.parquet', '.pq'))
+def read_parquet(filepath, columns=None, start=None, stop=None, **kwargs):
+    if start is None and stop is None:
+        return pd.read_parquet(filepath, columns=columns, **kwargs)
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        _require('pyarrow', 'Parquet')
+    pf = pq.ParquetFile(filepath)
+    n_rows = pf.metadata.num_rows
+    start, stop, _ = slice(start, stop).indices(n_rows)
+    # only read the row groups overlapping [start, stop)
+    groups = []
+    first_row = None
+    offset = 0
+    for i in range(pf.num_row_groups):
+        size = pf.metadata.row_group(i).num_rows
+        if offset + size > start and offset < stop:
+            groups.append(i)
+            if first_row is None:
+                first_row = offset
+        offset += size
+    if not groups:
+        return pf.schema_arrow.empty_table().to_pandas()[columns or slice(None)]
+    table = pf.read_row_groups(groups, columns=columns)
+    return table.slice(start - first_row, stop - start).to_pandas()
+
+
+# -- Feather ----------------------------------------------------------------
+
+@register_writer('feather', extensions=('.feather', '.arrow'))
+def write_feather(df, filepath, compression='uncompressed', **kwargs):
+    # uncompressed files can be memory mapped, so row ranges are zero copy
+    df.reset_index(drop=True).to_feather(filepath, compression=compression, **kwargs)
+
+
+@register_reader('feather', extensions=('.feather', '.arrow'))
+def read_feather(filepath, columns=None, start=None, stop=None, **kwargs):
+    try:
+        import pyarrow.feather as feather
+    except ImportError:
+        _require('pyarrow', 'Feather')
+    table = feather.read_table(filepath, columns=columns, memory_map=True, **kwargs)
+    if start is not None or stop is not None:
+        start, stop, _ = slice(start, stop).indices(table.num_rows)
+        table = table.slice(start, stop - start)
+    return table.to_pandas()
+
+
+# -- NPY --------------------------------------------------------------------
+
+# string columns with missing values get a bool field '<name>__na' as well
+_NA_SUFFIX = '__na'
+
+
+@register_writer('npy', extensions=('.npy',))
+def write_npy(df, filepath, **kwargs):
+    # one structured array, a field per column; string columns become fixed
+    # width unicode fields, other object columns are not supported
+    column_dtypes = {}
+    masks = {}
+    strings = {}
+    for name in df.columns:
+        dtype = df[name].dtype
+        if not (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)):
+            continue
+        missing = df[name].isna()
+        values = df[name].astype(object).where(~missing, '')
+        if not values.map(type).eq(str).all():
+            raise TypeError(f"NPY files can not hold the object column {name!r}, "
+                            "use a fixed width type or another format")
+        strings[name] = values
+        column_dtypes[name] = f'U{max(1, values.str.len().max())}'
+        if missing.any():
+            masks[f'{name}{_NA_SUFFIX}'] = missing.to_numpy()
+    if strings:
+        df = df.assign(**strings)
+    if masks:
+        df = df.assign(**masks)
+    records = df.to_records(index=False, column_dtypes=column_dtypes)
+    np.save(filepath, records, allow_pickle=False, **kwargs)
+
+
+@register_reader('npy', extensions=('.npy',))
+def read_npy(filepath, columns=None, start=None, stop=None, mmap_mode='r', **kwargs):
+    array = np.load(filepath, mmap_mode=mmap_mode, allow_pickle=False, **kwargs)
+    # memory mapped: slicing only touches the pages of the requested rows
+    array = array[start:stop]
+    if array.dtype.names is None:
+        # a plain 2d array
+        df = pd.DataFrame(np.asarray(array))
+        return _select(df, columns, None, None)
+    fields = set(array.dtype.names)
+    if columns is not None:
+        names = list(columns)
+    else:
+        names = [name for name in array.dtype.names
+                 if not (name.endswith(_NA_SUFFIX) and name[:-len(_NA_SUFFIX)] in fields)]
+    data = {}
+    for name in names:
+        values = pd.Series(np.asarray(array[name]))
+        mask = f'{name}{_NA_SUFFIX}'
+        if mask in fields:
+            values = values.where(~np.asarray(array[mask]))
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+# -- CSV --------------------------------------------------------------------
+
+@register_writer('csv', extensions=('.csv',))
+def write_csv(df, filepath, index=False, **kwargs):
+    df.to_csv(filepath, index=index, **kwargs)
+
+
+@register_reader('csv', extensions=('.csv',))
+def read_csv(filepath, columns=None, start=None, stop=None, **kwargs):
+    if start is not None and start < 0 or stop is not None and stop < 0:
+        # the length is only known after reading everything
+        return _select(pd.read_csv(filepath, usecols=columns, **kwargs), None, start, stop)
+    if start:
+        # skip data rows, keep the header line
+        kwargs['skiprows'] = range(1, start + 1)
+    if stop is not None:
+        kwargs['nrows'] = max(0, stop - (start or 0))
+    # usecols lets the parser drop the other columns right away
+    return pd.read_csv(filepath, usecols=columns, **kwargs)
+
+
+# -- FITS -------------------------------------------------------------------
+
+@register_writer('fits', extensions=('.fits', '.fit'))
+def write_fits(df, filepath, overwrite=True, **kwargs):
+    try:
+        from astropy.table import Table
+    except ImportError:
+        _require('astropy', 'FITS')
+    Table.from_pandas(df).write(filepath, format='fits', overwrite=overwrite, **kwargs)
+
+
+@register_reader('fits', extensions=('.fits', '.fit'))
+def read_fits(filepath, columns=None, start=None, stop=None, hdu=1, **kwargs):
+    try:
+        from astropy.io import fits
+        from astropy.table import Table
+    except ImportError:
+        _require('astropy', 'FITS')
+    # memmap: only the requested rows and columns are read from disk
+    with fits.open(filepath, memmap=True, **kwargs) as hdul:
+        data = hdul[hdu].data[start:stop]
+        table = Table(data)
+        if columns is not None:
+            table = table[list(columns)]
+        return table.to_pandas()
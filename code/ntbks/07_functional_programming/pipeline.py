@@ -0,0 +1,454 @@
+"""
+Lazy map / filter / reduce pipelines
+
+The notebook chains filter, sorted, map and list comprehensions; every step
+builds an intermediate list, and lambdas in comprehensions or generator
+expressions add an extra generator per step. A Pipeline only records the
+stages and runs them when a result is asked for:
+
+    total = Pipeline(range(BIG)).map(f).filter(lambda k: k % 3 == 0).sum()
+
+- all stages are fused into one generated loop, so each item goes through
+  one for loop and the stage functions only; no intermediate lists. This is
+  as fast as chaining the C implemented map and filter objects, which
+  cannot switch to NumPy or run in parallel
+- when the source is a numeric NumPy array and the stages are elementwise
+  arithmetic, the stages are applied to the whole array instead. Whether
+  this works is checked on a few items first: a stage that raises, does not
+  return an array of the same length, or gives a different result than the
+  plain loop keeps the pipeline on the plain loop.
+  NumPy integers are 64 bit and wrap around where Python ints grow. For
+  integer arrays the stages are run once more in float64 and the pipeline
+  falls back to the plain loop when the results disagree; sums and products
+  that could overflow are computed with Python ints. Ranges and lists stay
+  on the plain loop, pass np.arange(...) to opt in
+- .parallel() splits large sources into chunks and runs them in worker
+  processes (or threads). Stage functions then have to be picklable, i.e.
+  defined at module level, and reduce functions associative.
+"""
+import collections
+import functools
+import itertools
+import operator
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_MISSING = object()
+
+# number of items the vectorized stages are checked against the plain loop
+PROBE_SIZE = 16
+
+
+# -- fused loops ------------------------------------------------------------
+#
+# The loop for a sequence of stage kinds is generated as source code once
+# (like collections.namedtuple does) and cached, e.g. for map, filter, sum:
+#
+#     def _loop(source, f0, f1):
+#         acc = 0
+#         for x in source:
+#             x = f0(x)
+#             if not f1(x):
+#                 continue
+#             acc += x
+#         return acc
+
+_HEADERS = {
+    'iter': "",
+    'list': "out = []\nappend = out.append\n",
+    'sum': "acc = 0\n",
+    'count': "acc = 0\n",
+    'reduce': "",
+}
+
+_STEPS = {
+    'iter': "yield x\n",
+    'list': "append(x)\n",
+    'sum': "acc += x\n",
+    'count': "acc += 1\n",
+    'reduce': "acc = func(acc, x)\n",
+}
+
+_RESULTS = {'iter': "", 'list': "return out\n", 'sum': "return acc\n",
+            'count': "return acc\n", 'reduce': "return acc\n"}
+
+_LOOPS = {}
+
+
+def _indent(code, level):
+    return ''.join('    ' * level + line + '\n' for line in code.splitlines())
+
+
+def _compile_loop(kinds, terminal):
+    names = [f'f{i}' for i in range(len(kinds))]
+    body = ''
+    for name, kind in zip(names, kinds):
+        if kind == 'map':
+            body += f"x = {name}(x)\n"
+        else:
+            body += f"if not {name}(x):\n    continue\n"
+    params = ['source'] + (['acc', 'func'] if terminal == 'reduce' else []) + names
+    code = f"def _loop({', '.join(params)}):\n"
+    code += _indent(_HEADERS[terminal], 1)
+    if terminal == 'reduce':
+        # without an initial value the first item that passes all stages is the start
+        code += _indent("source = iter(source)\n"
+                        "if acc is MISSING:\n"
+                        "    for x in source:\n"
+                        + _indent(body, 2) +
+                        "        acc = x\n"
+                        "        break\n"
+                        "    else:\n"
+                        "        return MISSING\n", 1)
+    code += _indent("for x in source:\n" + _indent(body + _STEPS[terminal], 1), 1)
+    code += _indent(_RESULTS[terminal], 1)
+    namespace = {'MISSING': _MISSING}
+    exec(code, namespace)
+    return namespace['_loop']
+
+
+def _fuse(kinds, terminal):
+    key = (kinds, terminal)
+    loop = _LOOPS.get(key)
+    if loop is None:
+        loop = _LOOPS[key] = _compile_loop(kinds, terminal)
+    return loop
+
+
+def _run_loop(source, stages, terminal, func=None, initial=_MISSING):
+    kinds = tuple(kind for kind, _ in stages)
+    funcs = [f for _, f in stages]
+    loop = _fuse(kinds, terminal)
+    if terminal == 'reduce':
+        return loop(source, initial, func, *funcs)
+    return loop(source, *funcs)
+
+
+# -- vectorized execution ---------------------------------------------------
+
+if np is not None:
+    _UFUNCS = {operator.add: np.add, operator.mul: np.multiply,
+               max: np.maximum, min: np.minimum}
+else:
+    _UFUNCS = {}
+
+
+def _as_array(source):
+    """The source as a 1d numeric array, None if it is not one"""
+    if np is None:
+        return None
+    if isinstance(source, np.ndarray):
+        if source.ndim == 1 and source.dtype.kind in 'biuf':
+            return source
+        return None
+    return None
+
+
+def _apply_stages(array, stages):
+    """All stages applied to the whole array, None if one of them is not elementwise"""
+    for kind, f in stages:
+        try:
+            result = f(array)
+        except Exception:
+            return None
+        if not isinstance(result, np.ndarray) or result.shape != array.shape:
+            return None
+        if kind == 'map':
+            array = result
+        elif result.dtype == bool:
+            array = array[result]
+        else:
+            return None
+    return array
+
+
+def _run_vectorized(array, stages):
+    probe = array[:PROBE_SIZE]
+    expected = _run_loop(probe.tolist(), stages, 'list')
+    result = _apply_stages(probe, stages)
+    if result is None or result.tolist() != expected:
+        return None
+    result = _apply_stages(array, stages)
+    if result is not None and array.dtype.kind in 'biu' and not _no_overflow(array, stages, result):
+        return None
+    return result
+
+
+def _no_overflow(array, stages, result):
+    """Whether the stages on an integer array agree with a float64 run, which does not wrap around"""
+    with np.errstate(all='ignore'):
+        shadow = _apply_stages(array.astype(np.float64), stages)
+    if shadow is None or shadow.shape != result.shape or not np.isfinite(shadow).all():
+        return False
+    return bool(np.allclose(result, shadow, rtol=1e-6, atol=0))
+
+
+def _sum_fits(array):
+    """Whether summing an integer array can not overflow"""
+    if array.dtype.kind not in 'iu' or not array.size:
+        return True
+    largest = max(abs(int(array.min())), abs(int(array.max())))
+    return largest * array.size < 2**63
+
+
+def _finish_array(array, terminal, func=None, initial=_MISSING):
+    if terminal == 'array':
+        return array
+    if terminal == 'list':
+        return array.tolist()
+    if terminal == 'iter':
+        return iter(array.tolist())
+    if terminal == 'count':
+        return int(array.size)
+    if terminal == 'sum':
+        if not _sum_fits(array):
+            return sum(array.tolist())
+        return array.sum().item() if array.size else 0
+    # reduce
+    ufunc = func if isinstance(func, np.ufunc) else _UFUNCS.get(func)
+    if array.dtype.kind in 'iu' and (ufunc is np.multiply or ufunc is np.add and not _sum_fits(array)):
+        # products of 64 bit integers overflow quickly, Python ints do not
+        ufunc = None
+    if ufunc is None:
+        if initial is _MISSING:
+            return functools.reduce(func, array.tolist()) if array.size else _MISSING
+        return functools.reduce(func, array.tolist(), initial)
+    if not array.size:
+        return initial
+    result = ufunc.reduce(array).item()
+    return result if initial is _MISSING else func(initial, result)
+
+
+def _run(source, stages, vectorize, terminal, func=None, initial=_MISSING):
+    array = _as_array(source) if vectorize else None
+    if array is not None and array.size:
+        result = _run_vectorized(array, stages)
+        if result is not None:
+            if terminal == 'array' and np.may_share_memory(result, array):
+                # no stages (or identity maps): never hand out the caller's array
+                result = result.copy()
+            return _finish_array(result, terminal, func, initial)
+    if array is not None:
+        # the plain loop on Python numbers, NumPy scalars would wrap around as well
+        source = array.tolist()
+    if terminal == 'array':
+        result = _run_loop(source, stages, 'list')
+        return np.array(result)
+    return _run_loop(source, stages, terminal, func, initial)
+
+
+# -- chunked parallel execution ---------------------------------------------
+
+def _chunks(source, chunk_size):
+    if isinstance(source, (range, list, tuple)) or np is not None and isinstance(source, np.ndarray):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    else:
+        iterator = iter(source)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def _run_chunk(chunk, stages, vectorize, terminal, func):
+    result = _run(chunk, stages, vectorize, terminal, func)
+    if terminal == 'reduce':
+        # _MISSING is not the same object in another process
+        return result is not _MISSING, (None if result is _MISSING else result)
+    return result
+
+
+def _submit_bounded(pool, window, chunks, *args):
+    """Results of _run_chunk for every chunk, in order, with at most window chunks in flight"""
+    # pool.map would read the whole source before the first result comes back
+    pending = collections.deque()
+    for chunk in chunks:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(pool.submit(_run_chunk, chunk, *args))
+    while pending:
+        yield pending.popleft().result()
+
+
+class Pipeline:
+    """
+    Lazy chain of map and filter stages over an iterable
+
+    map / filter return a new Pipeline, nothing runs until one of to_list,
+    to_array, reduce, sum, count or iteration asks for the result.
+    """
+    __slots__ = ('source', 'stages', '_vectorize', '_parallel')
+
+    def __init__(self, source, stages=(), vectorize=True, parallel=None):
+        self.source = source
+        self.stages = tuple(stages)
+        self._vectorize = vectorize
+        self._parallel = parallel
+
+    def __repr__(self):
+        stages = ''.join(f".{kind}({getattr(f, '__name__', f)})" for kind, f in self.stages)
+        return f"Pipeline({type(self.source).__name__}){stages}"
+
+    def _replace(self, **changes):
+        options = dict(source=self.source, stages=self.stages,
+                       vectorize=self._vectorize, parallel=self._parallel)
+        options.update(changes)
+        return Pipeline(**options)
+
+    def map(self, func):
+        return self._replace(stages=self.stages + (('map', func),))
+
+    def filter(self, predicate):
+        return self._replace(stages=self.stages + (('filter', predicate),))
+
+    def vectorize(self, enabled=True):
+        """Allow (the default) or forbid NumPy execution"""
+        return self._replace(vectorize=enabled)
+
+    def parallel(self, workers=None, chunk_size=None, executor='process'):
+        """
+        Run in chunks on a pool of workers
+
+        executor -- 'process' (stage functions must be picklable) or 'thread'
+                    (only faster when the stages release the GIL, e.g. NumPy)
+        """
+        if executor not in ('process', 'thread'):
+            raise ValueError(f"executor must be 'process' or 'thread', not {executor!r}")
+        return self._replace(parallel=(workers or os.cpu_count() or 1, chunk_size, executor))
+
+    # -- execution ----------------------------------------------------------
+
+    def _execute(self, terminal, func=None, initial=_MISSING):
+        if self._parallel is None:
+            return _run(self.source, self.stages, self._vectorize, terminal, func, initial)
+        workers, chunk_size, executor = self._parallel
+        if chunk_size is None:
+            try:
+                # a few chunks per worker evens out their run times
+                chunk_size = max(1, -(-len(self.source) // (workers * 4)))
+            except TypeError:
+                chunk_size = 100000
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        chunk_terminal = 'list' if terminal == 'iter' else terminal
+        with pool_class(workers) as pool:
+            partials = _submit_bounded(pool, workers * 2, _chunks(self.source, chunk_size),
+                                       self.stages, self._vectorize, chunk_terminal, func)
+            if terminal in ('list', 'iter'):
+                result = list(itertools.chain.from_iterable(partials))
+                return result if terminal == 'list' else iter(result)
+            if terminal == 'array':
+                partials = list(partials)
+                return np.concatenate(partials) if partials else np.array([])
+            if terminal in ('sum', 'count'):
+                return sum(partials)
+            values = (value for found, value in partials if found)
+            if initial is _MISSING:
+                initial = next(values, _MISSING)
+                if initial is _MISSING:
+                    return _MISSING
+            return functools.reduce(func, values, initial)
+
+    def __iter__(self):
+        return self._execute('iter')
+
+    def to_list(self):
+        return self._execute('list')
+
+    def to_array(self):
+        if np is None:
+            raise ImportError("to_array needs numpy")
+        return self._execute('array')
+
+    def reduce(self, func, initial=_MISSING):
+        """functools.reduce over the items; func has to be associative when run in parallel"""
+        result = self._execute('reduce', func, initial)
+        if result is _MISSING:
+            raise TypeError("reduce() of empty pipeline with no initial value")
+        return result
+
+    def sum(self):
+        return self._execute('sum')
+
+    def count(self):
+        return self._execute('count')
+
+
+# picklable stages for the parallel benchmark
+def f(k):
+    return 2*k
+
+
+def is_multiple_of_3(k):
+    return k % 3 == 0
+
+
+if __name__ == '__main__':
+    import time
+
+    BIG = 5000000
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    def intermediate_lists():
+        doubled = [f(i) for i in range(BIG)]
+        return sum([k for k in doubled if is_multiple_of_3(k)])
+
+    def chained_iterators():
+        return sum(filter(is_multiple_of_3, map(f, range(BIG))))
+
+    pipeline = Pipeline(range(BIG)).map(f).filter(is_multiple_of_3)
+    expected = benchmark(intermediate_lists, "list comprehensions")
+    assert benchmark(chained_iterators, "sum(filter(map(...)))") == expected
+    assert benchmark(pipeline.vectorize(False).sum, "fused pipeline") == expected
+    assert benchmark(pipeline.vectorize(False).parallel().sum,
+                     f"fused pipeline on {os.cpu_count()} processes") == expected
+    if np is not None:
+        vectorized = Pipeline(np.arange(BIG)).map(lambda k: 2*k).filter(lambda k: k % 3 == 0)
+        assert benchmark(vectorized.sum, "vectorized pipeline") == expected
+        # k**5 wraps around in int64: the pipeline must notice and use Python ints
+        fifth = Pipeline(np.arange(20000)).map(lambda k: k**5)
+        assert fifth.sum() == Pipeline(range(20000)).map(lambda k: k**5).sum() == \
+            sum(k**5 for k in range(20000))
+    assert Pipeline([1, 2, 3, 4]).reduce(lambda x, y: x*y) == 24
+
+    class Employee:
+        def __init__(self, ID, name, age):
+            self.ID = ID
+            self.name = name
+            self.age = age
+
+    L = [Employee(1234, 'Alex', 25), Employee(9001, 'Alice', 23), Employee(8592, 'Bob', 18)]
+    print([item.name for item in sorted(Pipeline(L).filter(lambda x: x.ID > 2000), key=lambda i: i.ID)])
+
+    if np is not None:
+        x = np.arange(10)
+        assert Pipeline(x).to_array() is not x
+
+    # parallel on an iterator: only a window of chunks is read ahead
+    read = [0]
+    lag = [0]
+
+    def numbers():
+        for i in range(100000):
+            read[0] += 1
+            yield i
+
+    def behind(k):
+        lag[0] = max(lag[0], read[0] - k)
+        return k
+    lazy = Pipeline(numbers()).map(behind).parallel(workers=2, chunk_size=100, executor='thread')
+    assert lazy.reduce(operator.add) == sum(range(100000))
+    assert lag[0] <= 6 * 100
+    assert Pipeline(iter([])).parallel(executor='thread').reduce(operator.add, 0) == 0
@@ -0,0 +1,318 @@
+"""
+Weighted linear least squares
+
+Engine behind the `linleastsquares` class of the notebook
+"Object Oriented Programming Linear Least Squares.ipynb".
+
+The notebook version builds the dense weighting matrix
+W = np.diag(1/y_errors**2), which needs O(n^2) memory, and inverts A.T*W*A
+explicitly with the deprecated np.matrix type. Here the rows of the design
+matrix are scaled by 1/sigma instead, which gives the same weighted problem
+
+    min || (A x - y) / sigma ||^2
+
+and it is solved with a QR decomposition. Many independent data sets can be
+fitted in one batched call and data sets that do not fit into memory at once
+are handled by accumulating the normal equations chunk by chunk.
+
+For data arriving continuously `OnlineLinLeastSquares` updates a fit batch by
+batch without keeping the raw data.
+"""
+from collections import deque
+
+import numpy as np
+
+
+def design_matrix(functionlist, x_values):
+    """Return the design matrix A[i, j] = functionlist[j](x_values[i])"""
+    x_values = np.asarray(x_values, dtype=float)
+    A = np.empty(x_values.shape + (len(functionlist),))
+    for j, func in enumerate(functionlist):
+        A[..., j] = func(x_values)
+    return A
+
+
+def _whiten(A, y_values, y_errors):
+    """Scale rows of A and y by 1/sigma, so W never has to be built"""
+    w = 1 / np.asarray(y_errors, dtype=float)
+    return A * w[..., None], np.asarray(y_values, dtype=float) * w
+
+
+def _solve_qr(Aw, yw):
+    """Solve the whitened problem, works on stacks of problems too"""
+    Q, R = np.linalg.qr(Aw)
+    qty = np.einsum('...ni,...n->...i', Q, yw)
+    params = np.linalg.solve(R, qty[..., None])[..., 0]
+    # cov = (A.T W A)^-1 = (R.T R)^-1 = R^-1 R^-T
+    R_inv = np.linalg.inv(R)
+    cov = R_inv @ np.swapaxes(R_inv, -1, -2)
+    return params, cov
+
+
+class NormalEquations:
+    """
+    Accumulator of the sufficient statistics A.T W A and A.T W y
+
+    Only p x p numbers are kept, so arbitrarily many points can be added
+    chunk by chunk.
+    """
+    def __init__(self, n_params):
+        self.ATA = np.zeros((n_params, n_params))
+        self.ATy = np.zeros(n_params)
+        self.n_points = 0
+
+    def add(self, A, y_values, y_errors):
+        """Add the rows of design matrix A with values and errors"""
+        Aw, yw = _whiten(A, y_values, y_errors)
+        self.ATA += Aw.T @ Aw
+        self.ATy += Aw.T @ yw
+        self.n_points += len(yw)
+
+    def remove(self, A, y_values, y_errors):
+        """Remove rows previously added with add"""
+        Aw, yw = _whiten(A, y_values, y_errors)
+        self.ATA -= Aw.T @ Aw
+        self.ATy -= Aw.T @ yw
+        self.n_points -= len(yw)
+
+    def solve(self):
+        """Return the parameters and their covariance matrix"""
+        # A.T W A is symmetric positive definite for a well posed problem,
+        # so a Cholesky factorisation is both cheap and stable enough
+        L = np.linalg.cholesky(self.ATA)
+        L_inv = np.linalg.inv(L)
+        cov = L_inv.T @ L_inv
+        params = cov @ self.ATy
+        return params, cov
+
+
+class linleastsquares():
+
+    def __init__(self, functionlist):
+        '''
+        Initiate the object with the wanted list of functions
+        '''
+        self.functionlist = functionlist
+
+    def design_matrix(self, x_values):
+        return design_matrix(self.functionlist, x_values)
+
+    def fit(self, x_values, y_values, y_errors, print_matrix=False):
+        """
+        Calculate the parameters for the linear leastsquares model
+        of functions provided as argument functionlist for the x_values
+        and y_values with errors y_errors
+
+        Returns the parameters and the covariance matrix as arrays.
+        """
+        A = self.design_matrix(x_values)
+        if print_matrix is True:
+            print(A)
+        return _solve_qr(*_whiten(A, y_values, y_errors))
+
+    def fit_many(self, x_values, y_values, y_errors):
+        """
+        Fit m independent data sets in one batched call
+
+        y_values and y_errors have shape (m, n), x_values is either shared
+        by all data sets with shape (n,) or given per data set as (m, n).
+        Returns parameters of shape (m, p) and covariances (m, p, p).
+        """
+        y_values = np.asarray(y_values, dtype=float)
+        y_errors = np.broadcast_to(np.asarray(y_errors, dtype=float), y_values.shape)
+        A = self.design_matrix(x_values)
+        if A.ndim == 2:
+            A = np.broadcast_to(A, y_values.shape + A.shape[-1:])
+        return _solve_qr(*_whiten(A, y_values, y_errors))
+
+    def fit_chunked(self, x_values, y_values, y_errors, chunk_size=1000000):
+        """
+        Fit very large data sets by accumulating the normal equations
+        chunk by chunk; only one chunk of the design matrix is in memory.
+
+        The arguments may also be memory mapped arrays (np.load(..., mmap_mode='r')).
+        """
+        y_errors = np.broadcast_to(y_errors, np.shape(y_values))
+        acc = NormalEquations(len(self.functionlist))
+        for start in range(0, len(y_values), chunk_size):
+            stop = start + chunk_size
+            acc.add(self.design_matrix(x_values[start:stop]),
+                    y_values[start:stop], y_errors[start:stop])
+        return acc.solve()
+
+    def fit_stream(self, chunks):
+        """Fit an iterable of (x_values, y_values, y_errors) chunks"""
+        acc = NormalEquations(len(self.functionlist))
+        for x_values, y_values, y_errors in chunks:
+            acc.add(self.design_matrix(x_values), y_values, y_errors)
+        return acc.solve()
+
+
+def _woodbury(P, Aw, sign):
+    """
+    Rank-k update of P = (A.T W A)^-1 for whitened rows Aw being added
+    (sign=+1) or removed (sign=-1), O(k p^2 + k^3) instead of O(p^3)
+    """
+    PA = P @ Aw.T
+    S = Aw @ PA + sign * np.eye(len(Aw))
+    return P - PA @ np.linalg.solve(S, PA.T)
+
+
+class OnlineLinLeastSquares:
+    """
+    Recursive weighted least squares fit for continuously arriving data
+
+    Keeps the sufficient statistics A.T W A, A.T W y and the covariance
+    P = (A.T W A)^-1. Every new point updates P with the Sherman-Morrison /
+    Woodbury formula in O(p^2), the raw data is not stored.
+
+    With window=k only the last k batches passed to update contribute to the
+    fit; per batch just its p x p summary is kept so the oldest batch can be
+    subtracted again when it leaves the window. Without a window single old
+    observations can be removed explicitly with remove.
+    """
+    def __init__(self, functionlist, window=None):
+        self.functionlist = functionlist
+        self.window = window
+        self._stats = NormalEquations(len(functionlist))
+        self._batches = deque()
+        self._P = None
+
+    @property
+    def n_points(self):
+        return self._stats.n_points
+
+    @property
+    def params(self):
+        if self._P is None:
+            return None
+        return self._P @ self._stats.ATy
+
+    @property
+    def cov(self):
+        return None if self._P is None else self._P.copy()
+
+    def update(self, x_values, y_values, y_errors):
+        """Add a batch of observations and update the fit"""
+        A = design_matrix(self.functionlist, np.atleast_1d(x_values))
+        y_values = np.atleast_1d(y_values)
+        y_errors = np.broadcast_to(y_errors, y_values.shape)
+        Aw, yw = _whiten(A, y_values, y_errors)
+        self._stats.add(A, y_values, y_errors)
+        if self.window is not None:
+            self._batches.append((Aw.T @ Aw, Aw.T @ yw, len(yw)))
+
+        if self._P is None:
+            self.refresh()
+        else:
+            self._rank_update(Aw, +1)
+
+        if self.window is not None and len(self._batches) > self.window:
+            ATA, ATy, n = self._batches.popleft()
+            self._stats.ATA -= ATA
+            self._stats.ATy -= ATy
+            self._stats.n_points -= n
+            # only the p x p summary of the batch is known, so P is rebuilt
+            # from the statistics, O(p^3) independent of the number of points
+            self.refresh()
+        return self
+
+    def remove(self, x_values, y_values, y_errors):
+        """Remove old observations from the fit; not with a window"""
+        if self.window is not None:
+            # the batch summaries would subtract them a second time on eviction
+            raise ValueError("remove() can not be combined with a window, the window drops old batches")
+        A = design_matrix(self.functionlist, np.atleast_1d(x_values))
+        y_values = np.atleast_1d(y_values)
+        y_errors = np.broadcast_to(y_errors, y_values.shape)
+        self._stats.remove(A, y_values, y_errors)
+        if self._P is not None:
+            self._rank_update(_whiten(A, y_values, y_errors)[0], -1)
+        return self
+
+    def refresh(self):
+        """Recompute P from the statistics, e.g. to clear rounding drift"""
+        try:
+            _, self._P = self._stats.solve()
+        except np.linalg.LinAlgError:
+            # not enough points yet to determine all parameters
+            self._P = None
+        return self
+
+    def _rank_update(self, Aw, sign):
+        # blocks of at most p rows keep every update at O(p^2) per point
+        p = len(self.functionlist)
+        for start in range(0, len(Aw), p):
+            self._P = _woodbury(self._P, Aw[start:start + p], sign)
+
+
+def _reference_fit(functionlist, x_values, y_values, y_errors):
+    """The original notebook algorithm with the dense W, for comparisons only"""
+    A = design_matrix(functionlist, x_values)
+    W = np.diag(1 / y_errors**2)
+    invATA = np.linalg.inv(A.T @ W @ A)
+    return invATA @ A.T @ W @ y_values, invATA
+
+
+if __name__ == '__main__':
+    import os
+    import time
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    llsq = linleastsquares([np.sin, np.cos])
+
+    # compare with the original implementation on the notebook data
+    # (or on synthetic data of the same shape when it is not available)
+    if os.path.exists("data/llsq/data.txt"):
+        x, y = np.genfromtxt("data/llsq/data.txt", unpack=True)
+    else:
+        rng = np.random.default_rng(1337)
+        x = np.linspace(0, 10, 1000)
+        y = 0.7 * np.sin(x) - 0.3 * np.cos(x) + rng.normal(0, 0.011, x.size)
+    y_err = np.ones(len(y)) * 0.011
+
+    params, cov = benchmark(lambda: llsq.fit(x, y, y_err), "QR fit")
+    ref_params, ref_cov = benchmark(lambda: _reference_fit(llsq.functionlist, x, y, y_err),
+                                    "dense W reference")
+    assert np.allclose(params, ref_params) and np.allclose(cov, ref_cov)
+    print("parameters", params)
+
+    # many data sets at once
+    rng = np.random.default_rng(42)
+    Y = y + rng.normal(0, 0.011, (500, len(y)))
+    many_params, many_cov = benchmark(lambda: llsq.fit_many(x, Y, y_err), "500 data sets batched")
+    assert np.allclose(many_params[0], llsq.fit(x, Y[0], y_err)[0])
+
+    # millions of points
+    x_big = rng.uniform(0, 10, 5000000)
+    y_big = 0.7 * np.sin(x_big) - 0.3 * np.cos(x_big) + rng.normal(0, 0.011, x_big.size)
+    big_params, _ = benchmark(lambda: llsq.fit_chunked(x_big, y_big, 0.011), "5M points chunked")
+    print("parameters", big_params)
+
+    # data arriving in batches, fitted online and over a sliding window
+    online = OnlineLinLeastSquares(llsq.functionlist)
+    windowed = OnlineLinLeastSquares(llsq.functionlist, window=10)
+    for start in range(0, 100000, 1000):
+        batch = slice(start, start + 1000)
+        online.update(x_big[batch], y_big[batch], 0.011)
+        windowed.update(x_big[batch], y_big[batch], 0.011)
+    full_params, full_cov = llsq.fit(x_big[:100000], y_big[:100000], np.full(100000, 0.011))
+    assert np.allclose(online.params, full_params) and np.allclose(online.cov, full_cov)
+    window_params, _ = llsq.fit(x_big[90000:100000], y_big[90000:100000], np.full(10000, 0.011))
+    assert np.allclose(windowed.params, window_params)
+    online.remove(x_big[:50000], y_big[:50000], 0.011)
+    assert np.allclose(online.params, llsq.fit(x_big[50000:100000], y_big[50000:100000],
+                                               np.full(50000, 0.011))[0])
+    print("online parameters", online.params)
+    try:
+        windowed.remove(x_big[:10], y_big[:10], 0.011)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("remove() with a window must be refused")
@@ -0,0 +1,558 @@
+"""
+Concurrent asyncio crawler
+
+crawler.ipynb fetches one page with a blocking requests.get and parses it
+right away. To crawl thousands of job listing pages this module
+
+- runs a bounded number of fetch workers on an asyncio queue
+- keeps HTTP/1.1 connections alive and reuses them per host
+- limits the request rate per host
+- retries failed requests with exponential backoff
+- caches responses on disk and revalidates them with ETag / Last-Modified
+- hands the HTML parsing to a pool of worker processes, so the event loop
+  keeps fetching while pages are parsed
+
+Only the standard library is used:
+
+    crawler = Crawler(["https://realpython.github.io/fake-jobs/"],
+                      max_pages=1000, cache_dir=".crawl_cache")
+    pages = asyncio.run(crawler.run())
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import ssl
+import time
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urldefrag, urlsplit
+
+USER_AGENT = "programming-python-crawler/1.0"
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class FetchError(Exception):
+    """Raised when a page can not be fetched, also after all retries"""
+
+
+class Response:
+    def __init__(self, url, status, headers, body, from_cache=False):
+        self.url = url
+        self.status = status
+        self.headers = headers      # lower case names
+        self.body = body
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    def __repr__(self):
+        return f"<Response [{self.status}] {self.url}>"
+
+
+# -- connections ------------------------------------------------------------
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Keep-alive connections per (scheme, host, port)"""
+    def __init__(self, max_per_host=8, ssl_context=None):
+        self.max_per_host = max_per_host
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._idle = {}
+        self._limits = {}
+        self.opened = 0
+
+    def _key(self, url):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        return parts.scheme, parts.hostname, port
+
+    async def acquire(self, url):
+        key = self._key(url)
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.max_per_host))
+        await limit.acquire()
+        idle = self._idle.setdefault(key, [])
+        while idle:
+            conn = idle.pop()
+            if not conn.writer.is_closing() and not conn.reader.at_eof():
+                return conn
+            conn.close()
+        scheme, host, port = key
+        try:
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=self.ssl_context if scheme == 'https' else None)
+        except BaseException:
+            limit.release()
+            raise
+        self.opened += 1
+        return _Connection(reader, writer)
+
+    def release(self, url, conn, reusable=True):
+        key = self._key(url)
+        if reusable:
+            self._idle[key].append(conn)
+        else:
+            conn.close()
+        self._limits[key].release()
+
+    def close(self):
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+
+
+async def _read_response(reader, method):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("connection closed by server")
+    version, status, *_ = status_line.decode('latin-1').split(' ', 2)
+    status = int(status)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = (version == 'HTTP/1.1'
+                  and headers.get('connection', '').lower() != 'close')
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+        return status, headers, b'', keep_alive
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # skip trailers
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        return status, headers, b''.join(chunks), keep_alive
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+        return status, headers, body, keep_alive
+    # no length: the body ends with the connection
+    return status, headers, await reader.read(), False
+
+
+# -- cache and rate limits --------------------------------------------------
+
+class ResponseCache:
+    """On-disk cache of response bodies with their validators"""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            with open(path + '.body', 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return Response(url, meta['status'], meta['headers'], body, from_cache=True)
+
+    def put(self, response):
+        path = self._path(response.url)
+        # body first: a metadata file is only there for a complete body
+        with open(path + '.body', 'wb') as f:
+            f.write(response.body)
+        with open(path + '.json', 'w') as f:
+            json.dump({'status': response.status, 'headers': response.headers,
+                       'stored': time.time()}, f)
+
+    @staticmethod
+    def validators(response):
+        """Request headers revalidating a cached response"""
+        headers = {}
+        if 'etag' in response.headers:
+            headers['If-None-Match'] = response.headers['etag']
+        if 'last-modified' in response.headers:
+            headers['If-Modified-Since'] = response.headers['last-modified']
+        return headers
+
+
+class HostRateLimiter:
+    """At most `rate` requests per second to any single host"""
+    def __init__(self, rate=5.0):
+        self.interval = 1 / rate if rate else 0.0
+        self._next = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+# -- client -----------------------------------------------------------------
+
+class HttpClient:
+    """Minimal asyncio HTTP/1.1 client with pooling, retries and caching"""
+    def __init__(self, max_per_host=8, rate_per_host=5.0, retries=3,
+                 backoff=0.5, timeout=30.0, cache_dir=None):
+        self.pool = ConnectionPool(max_per_host)
+        self.limiter = HostRateLimiter(rate_per_host)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.stats = {'requests': 0, 'retries': 0, 'revalidated': 0}
+
+    async def get(self, url, max_redirects=5):
+        cached = self.cache.get(url) if self.cache else None
+        headers = ResponseCache.validators(cached) if cached else {}
+        for _ in range(max_redirects + 1):
+            status, resp_headers, body = await self._request_with_retries(url, headers)
+            if status in REDIRECTS and 'location' in resp_headers:
+                url = urljoin(url, resp_headers['location'])
+                cached = self.cache.get(url) if self.cache else None
+                headers = ResponseCache.validators(cached) if cached else {}
+                continue
+            break
+        else:
+            raise FetchError(f"too many redirects for {url}")
+
+        if status == 304 and cached is not None:
+            self.stats['revalidated'] += 1
+            return cached
+        response = Response(url, status, resp_headers, body)
+        if self.cache and status == 200 and ('etag' in resp_headers
+                                             or 'last-modified' in resp_headers):
+            self.cache.put(response)
+        return response
+
+    async def _request_with_retries(self, url, headers):
+        for attempt in range(self.retries + 1):
+            try:
+                status, resp_headers, body = await asyncio.wait_for(
+                    self._request(url, headers), self.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                error = e
+            else:
+                if status != 429 and status < 500:
+                    return status, resp_headers, body
+                error = FetchError(f"HTTP {status} for {url}")
+            if attempt == self.retries:
+                raise FetchError(f"giving up on {url}: {error}") from error
+            self.stats['retries'] += 1
+            # exponential backoff with jitter so retries of many workers spread out
+            await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    async def _request(self, url, headers):
+        parts = urlsplit(url)
+        await self.limiter.wait(parts.hostname)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        host = parts.netloc
+        lines = [f"GET {path} HTTP/1.1", f"Host: {host}", f"User-Agent: {USER_AGENT}",
+                 "Accept-Encoding: identity", "Connection: keep-alive"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        conn = await self.pool.acquire(url)
+        reusable = False
+        try:
+            conn.writer.write(request)
+            await conn.writer.drain()
+            status, resp_headers, body, reusable = await _read_response(conn.reader, 'GET')
+        finally:
+            self.pool.release(url, conn, reusable)
+        self.stats['requests'] += 1
+        return status, resp_headers, body
+
+    def close(self):
+        self.pool.close()
+
+
+# -- parsing ----------------------------------------------------------------
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.links = []
+        self.title = ''
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.links.append(href)
+        elif tag == 'title':
+            self._in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+def parse_links(url, html):
+    """
+    Default page parser: returns (data, links to follow)
+
+    Runs in a worker process, so it has to be a module level function.
+    """
+    parser = _LinkParser()
+    parser.feed(html)
+    links = [urldefrag(urljoin(url, href))[0] for href in parser.links]
+    return {'url': url, 'title': parser.title.strip()}, links
+
+
+# -- crawler ----------------------------------------------------------------
+
+class Crawler:
+    """
+    Breadth first crawler
+
+    start_urls       -- pages to start with
+    parse            -- function(url, html) -> (data, links), run in the
+                        worker pool; must be picklable
+    max_pages        -- stop after this many fetched pages
+    allowed_hosts    -- only follow links to these hosts (default: hosts of
+                        the start urls)
+    concurrency      -- number of concurrent fetches
+    parse_workers    -- processes parsing pages, 0 parses in the event loop
+    """
+    def __init__(self, start_urls, parse=parse_links, max_pages=100,
+                 allowed_hosts=None, concurrency=20, parse_workers=None,
+                 max_per_host=8, rate_per_host=5.0, retries=3,
+                 cache_dir=None):
+        self.start_urls = list(start_urls)
+        self.parse = parse
+        self.max_pages = max_pages
+        self.allowed_hosts = set(allowed_hosts or (urlsplit(u).hostname for u in self.start_urls))
+        self.concurrency = concurrency
+        self.parse_workers = parse_workers
+        self.client = HttpClient(max_per_host=max_per_host, rate_per_host=rate_per_host,
+                                 retries=retries, cache_dir=cache_dir)
+        self.results = []
+        self.errors = {}
+
+    def _should_follow(self, url):
+        parts = urlsplit(url)
+        return parts.scheme in ('http', 'https') and parts.hostname in self.allowed_hosts
+
+    async def run(self):
+        """Crawl and return the parsed data of all pages"""
+        queue = asyncio.Queue()
+        seen = set()
+        for url in self.start_urls:
+            seen.add(url)
+            queue.put_nowait(url)
+
+        loop = asyncio.get_running_loop()
+        executor = ProcessPoolExecutor(self.parse_workers) if self.parse_workers != 0 else None
+        budget = [self.max_pages]
+
+        async def worker():
+            while True:
+                url = await queue.get()
+                try:
+                    if budget[0] <= 0:
+                        continue
+                    budget[0] -= 1
+                    try:
+                        response = await self.client.get(url)
+                    except FetchError as e:
+                        self.errors[url] = str(e)
+                        continue
+                    except Exception as e:
+                        # e.g. an OSError writing the cache; the worker must
+                        # survive, or queue.join() never returns
+                        self.errors[url] = f"{type(e).__name__}: {e}"
+                        continue
+                    if response.status != 200:
+                        self.errors[url] = f"HTTP {response.status}"
+                        continue
+                    try:
+                        if executor is None:
+                            data, links = self.parse(response.url, response.text)
+                        else:
+                            data, links = await loop.run_in_executor(
+                                executor, self.parse, response.url, response.text)
+                    except Exception as e:
+                        self.errors[url] = f"parse failed: {type(e).__name__}: {e}"
+                        continue
+                    self.results.append(data)
+                    for link in links:
+                        if link not in seen and self._should_follow(link):
+                            seen.add(link)
+                            queue.put_nowait(link)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if executor is not None:
+                executor.shutdown()
+            self.client.close()
+        return self.results
+
+
+# -- local fake jobs site ---------------------------------------------------
+
+def fake_jobs_html(page, n_pages, jobs_per_page=20):
+    """A page in the layout of https://realpython.github.io/fake-jobs/"""
+    cards = []
+    for i in range(jobs_per_page):
+        job = page * jobs_per_page + i
+        title = ("Senior Python Developer", "Energy engineer", "Psychiatrist")[job % 3]
+        cards.append(f"""
+      <div class="column is-half">
+        <div class="card">
+          <div class="card-content">
+            <div class="media">
+              <div class="media-content">
+                <h2 class="title is-5">{title}</h2>
+                <h3 class="subtitle is-6 company">Company {job}</h3>
+              </div>
+            </div>
+            <div class="content">
+              <p class="location">
+                Town {job % 50}, AA
+              </p>
+              <p class="is-small has-text-grey">
+                <time datetime="2021-04-08">2021-04-08</time>
+              </p>
+            </div>
+            <footer class="card-footer">
+              <a href="https://www.realpython.com" class="card-footer-item">Learn</a>
+              <a href="/jobs/job-{job}.html" class="card-footer-item">Apply</a>
+            </footer>
+          </div>
+        </div>
+      </div>""")
+    nav = ''.join(f'<a href="/page-{p}.html">{p}</a>' for p in (page - 1, page + 1)
+                  if 0 <= p < n_pages)
+    return (f"<html><head><title>Fake Python page {page}</title></head><body>"
+            f"<div id=\"ResultsContainer\" class=\"columns is-multiline\">{''.join(cards)}"
+            f"</div><nav>{nav}</nav></body></html>")
+
+
+def serve_fake_jobs(n_pages=50, port=0):
+    """
+    Serve fake job pages on localhost in a background thread, with ETag and
+    Last-Modified support. Returns the server, stop it with shutdown().
+    """
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    last_modified = formatdate(time.time(), usegmt=True)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'       # keep-alive
+        # headers and body are written separately, without this every
+        # response on a kept alive connection waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path.startswith('/jobs/'):
+                body = f"<html><head><title>{self.path}</title></head></html>".encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.path in ('/', '/index.html'):
+                page = 0
+            elif self.path.startswith('/page-'):
+                page = int(self.path[len('/page-'):-len('.html')])
+            else:
+                page = None
+            if page is None or page >= n_pages:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            etag = f'"page-{page}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            body = fake_jobs_html(page, n_pages).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _failing_parse(url, html):
+    raise ValueError("broken parser")
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    server = serve_fake_jobs(n_pages=50)
+    start_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for run in ("cold cache", "warm cache"):
+            crawler = Crawler([start_url], max_pages=5000, concurrency=20,
+                              rate_per_host=0, parse_workers=2, cache_dir=cache_dir)
+            start = time.perf_counter()
+            pages = asyncio.run(crawler.run())
+            end = time.perf_counter()
+            print("{0:.3f} seconds for {1}: {2} pages, {3} connections, {4}".format(
+                end - start, run, len(pages), crawler.client.pool.opened, crawler.client.stats))
+            # 50 listing pages with 20 job detail pages each, page 0 is
+            # reached both as / and /page-0.html
+            assert len(pages) == 1 + 50 * 21 and not crawler.errors
+
+    # a parser that always raises must not kill the workers (run() used to hang)
+    urls = [f"{start_url}page-{p}.html" for p in range(5)]
+    crawler = Crawler(urls, parse=_failing_parse, concurrency=2, rate_per_host=0,
+                      parse_workers=0)
+    pages = asyncio.run(asyncio.wait_for(crawler.run(), timeout=30))
+    assert pages == [] and len(crawler.errors) == 5, crawler.errors
+    print("failing parser:", next(iter(crawler.errors.values())))
+    server.shutdown()
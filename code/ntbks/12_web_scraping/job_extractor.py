@@ -0,0 +1,247 @@
+"""
+Single pass job card extractor
+
+crawler.ipynb walks the BeautifulSoup tree again and again: find_all('p')
+inside list(...)[i], three job_element.find(...) calls per card and
+h2.parent.parent.parent to get from a title back to its card. The extractor
+below reads the HTML once, as a stream of start / end tags, and yields one
+typed JobPosting per card as soon as the card is closed:
+
+    for job in iter_job_postings(open("fake-jobs.html", "rb")):
+        print(job.title, job.company, job.location)
+
+    python_jobs = [job for job in iter_job_postings(html) if job.is_python]
+
+Two backends are available: the standard library html.parser and, when it is
+installed, the faster lxml pull parser (backend='lxml').
+"""
+import codecs
+import io
+from html.parser import HTMLParser
+from typing import List, NamedTuple
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+CHUNK_SIZE = 1 << 16
+
+
+class JobPosting(NamedTuple):
+    title: str
+    company: str
+    location: str
+    posted: str
+    links: List[str]
+
+    @property
+    def is_python(self):
+        return 'python' in self.title.lower()
+
+    @property
+    def apply_link(self):
+        return self.links[-1] if self.links else None
+
+
+# the field a text node belongs to, by (tag, css class)
+_FIELDS = {
+    ('h2', 'title'): 'title',
+    ('h3', 'company'): 'company',
+    ('p', 'location'): 'location',
+}
+
+
+class _CardBuilder:
+    """Collects the fields of one card from start / end / text events"""
+    def __init__(self):
+        self.fields = {'title': [], 'company': [], 'location': []}
+        self.posted = ''
+        self.links = []
+        self.current = None     # (field, tag) while inside a field element
+
+    def start(self, tag, classes, attrs):
+        if self.current is None:
+            for cls in classes:
+                field = _FIELDS.get((tag, cls))
+                if field is not None:
+                    self.current = (field, tag)
+                    break
+        if tag == 'a' and attrs.get('href'):
+            self.links.append(attrs['href'])
+        elif tag == 'time':
+            self.posted = attrs.get('datetime', '')
+
+    def end(self, tag):
+        if self.current is not None and self.current[1] == tag:
+            self.current = None
+
+    def text(self, data):
+        if self.current is not None:
+            self.fields[self.current[0]].append(data)
+
+    def build(self):
+        return JobPosting(''.join(self.fields['title']).strip(),
+                          ''.join(self.fields['company']).strip(),
+                          ''.join(self.fields['location']).strip(),
+                          self.posted, self.links)
+
+
+class _StdlibExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.done = []
+        self.card = None
+        self.depth = 0      # open <div>s inside the current card
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if self.card is None:
+            if tag == 'div' and 'card-content' in classes:
+                self.card = _CardBuilder()
+                self.depth = 1
+            return
+        if tag == 'div':
+            self.depth += 1
+        self.card.start(tag, classes, attrs)
+
+    def handle_endtag(self, tag):
+        if self.card is None:
+            return
+        if tag == 'div':
+            self.depth -= 1
+            if self.depth == 0:
+                self.done.append(self.card.build())
+                self.card = None
+                return
+        self.card.end(tag)
+
+    def handle_data(self, data):
+        if self.card is not None:
+            self.card.text(data)
+
+
+def _chunks(source, chunk_size):
+    """Yield text chunks of a str, bytes or (binary or text) file object"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    elif isinstance(source, str):
+        source = io.StringIO(source)
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_stdlib(source, chunk_size):
+    parser = _StdlibExtractor()
+    # multi byte characters may be split between two chunks
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in _chunks(source, chunk_size):
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        parser.feed(chunk)
+        if parser.done:
+            yield from parser.done
+            parser.done.clear()
+    parser.close()
+    yield from parser.done
+
+
+def _iter_lxml(source, chunk_size):
+    parser = etree.HTMLPullParser(events=('start', 'end'))
+    card = None
+    card_element = None
+    for chunk in _chunks(source, chunk_size):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                classes = (element.get('class') or '').split()
+                if card is None:
+                    if element.tag == 'div' and 'card-content' in classes:
+                        card = _CardBuilder()
+                        card_element = element
+                    continue
+                card.start(element.tag, classes, element.attrib)
+            elif element is card_element:
+                yield card.build()
+                card = card_element = None
+                # drop the finished card and everything before it, so memory
+                # stays flat however long the page is
+                element.clear()
+                node = element
+                while node is not None:
+                    while node.getprevious() is not None:
+                        del node.getparent()[0]
+                    node = node.getparent()
+            elif card is not None:
+                # on 'end' the text of the element is complete
+                if card.current is not None and card.current[1] == element.tag:
+                    card.text(''.join(element.itertext()))
+                card.end(element.tag)
+    parser.close()
+
+
+def iter_job_postings(source, backend='html.parser', chunk_size=CHUNK_SIZE):
+    """
+    Stream JobPosting records out of a job listing page
+
+    source  -- HTML as str or bytes, or a file object opened in text or
+               binary mode (it is read chunk by chunk)
+    backend -- 'html.parser' (standard library) or 'lxml'
+    """
+    if backend == 'lxml':
+        if etree is None:
+            raise ImportError("backend='lxml' needs the lxml package")
+        return _iter_lxml(source, chunk_size)
+    if backend == 'html.parser':
+        return _iter_stdlib(source, chunk_size)
+    raise ValueError(f"unknown backend {backend!r}")
+
+
+def extract_job_postings(source, backend='html.parser'):
+    """All postings of a page as a list"""
+    return list(iter_job_postings(source, backend))
+
+
+if __name__ == '__main__':
+    import time
+
+    from async_crawler import fake_jobs_html
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.3f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    html = fake_jobs_html(0, 1, jobs_per_page=100000)
+    print("synthetic page: {0:.1f} MB".format(len(html) / 1e6))
+
+    jobs = benchmark(lambda: extract_job_postings(html), "html.parser single pass")
+    assert len(jobs) == 100000
+    print(jobs[0])
+    print(sum(job.is_python for job in jobs), "python jobs")
+
+    if etree is not None:
+        lxml_jobs = benchmark(lambda: extract_job_postings(html.encode(), backend='lxml'),
+                              "lxml single pass")
+        assert lxml_jobs == jobs
+
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError:
+        BeautifulSoup = None
+    if BeautifulSoup is not None:
+        def notebook_style():
+            results = BeautifulSoup(html, "html.parser").find(id="ResultsContainer")
+            out = []
+            for job_element in results.find_all("div", class_="card-content"):
+                out.append((job_element.find("h2", class_="title").text.strip(),
+                            job_element.find("h3", class_="company").text.strip(),
+                            job_element.find("p", class_="location").text.strip()))
+            return out
+        benchmark(notebook_style, "BeautifulSoup find/find_all")
@@ -0,0 +1,552 @@
+"""
+Async query service for the Academic Management System
+
+A small HTTP/1.1 JSON server (asyncio streams, no web framework) in front of
+an AcademicManagementSystem:
+
+    GET  /students/<id>                  name, program, courses and GPA
+    GET  /students/<id>/gpa
+    GET  /courses/<code>
+    GET  /programs/<program>/top?k=10    best students of a program
+    GET  /stats
+    POST /students     {"name", "age", "email", "program"}
+    POST /courses      {"code", "name", "credits"}
+    POST /enrollments  {"student", "course"}
+    POST /grades       {"student", "course", "grade"}
+
+Reads never touch the live objects. They are answered from a snapshot: plain
+dicts with the summaries of all students and courses, replaced as a whole
+after every write batch. A reader therefore sees either all or none of the
+writes of a batch, even while the next batch is being applied.
+
+Concurrent identical reads are coalesced: the encoded response of a query
+is kept until the next snapshot (at most max_cached of them), so a burst of
+/programs/.../top requests computes the ranking once. Queries are cached by
+what they ask for, not by their URL: /programs/Physics/top?k=10&x=1 shares
+the entry of /programs/Physics/top?k=010.
+
+Writes are queued. One writer takes everything that is waiting (up to
+max_batch), applies it in a worker thread, appends it to the journal with
+one fsync (a group commit) and publishes the new snapshot; only then are
+the requests answered. Opening a service on an existing journal replays it.
+If writing the journal fails, the changes of that batch are never published
+and the service stops taking writes (503), reads keep working on the last
+snapshot. stop() answers the writes still queued before returning.
+
+    python academic_service.py              # load generator benchmark
+"""
+import asyncio
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from student_management import AcademicManagementSystem, Course, Student
+
+_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 409: 'Conflict', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+# encoded responses kept per snapshot
+MAX_CACHED = 4096
+
+# POST /<collection> -> write operation
+_WRITE_OPERATIONS = {'students': 'register', 'courses': 'course',
+                     'enrollments': 'enroll', 'grades': 'grade'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Snapshot(NamedTuple):
+    version: int
+    students: dict      # id -> summary
+    courses: dict       # code -> summary
+
+
+def student_summary(student):
+    return {'id': student.id, 'name': student.name, 'program': student.program,
+            'courses': [course.code for course in student.courses],
+            'gpa': student.calculate_gpa()}
+
+
+def course_summary(course):
+    return {'code': course.code, 'name': course.name, 'credits': course.credits,
+            'enrolled': len(course.enrolled_students)}
+
+
+class AcademicService:
+    """Snapshot reads and group-committed writes for an AcademicManagementSystem"""
+    def __init__(self, ams=None, journal_path=None, max_batch=256, coalesce=True, sync=True,
+                 max_cached=MAX_CACHED):
+        self.ams = ams or AcademicManagementSystem()
+        self.max_batch = max_batch
+        self.coalesce = coalesce
+        self.max_cached = max_cached
+        self.sync = sync
+        self._students = {student.id: student for student in self.ams.students}
+        self._courses = {course.code: course for course in self.ams.courses}
+        self._journal = None
+        if journal_path is not None:
+            if os.path.exists(journal_path):
+                self._replay(journal_path)
+            self._journal = open(journal_path, 'a', encoding='utf-8')
+        self._snapshot = Snapshot(0, {sid: student_summary(s) for sid, s in self._students.items()},
+                                  {code: course_summary(c) for code, c in self._courses.items()})
+        self._responses = {}    # query -> encoded response body, for the current snapshot
+        self._writes = None
+        self._writer = None
+        self._server = None
+        self._stopping = False
+        self._failed = None     # journal error which stopped the writes
+        # writes are applied one batch after the other in this thread
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='academic-writer')
+        self.stats = {'reads': 0, 'coalesced': 0, 'writes': 0, 'batches': 0}
+
+    # -- writes -------------------------------------------------------------
+
+    def _student(self, sid):
+        try:
+            return self._students[sid]
+        except KeyError:
+            raise HTTPError(404, f"no student {sid}") from None
+
+    def _course(self, code):
+        try:
+            return self._courses[code]
+        except KeyError:
+            raise HTTPError(404, f"no course {code}") from None
+
+    def _apply(self, op, args):
+        """Apply one write to the live objects: (result, changed student ids, changed course codes)"""
+        if op == 'register':
+            student = Student(args['name'], args['age'], args['email'], args['program'])
+            if 'id' in args:
+                # replayed from the journal; write() never passes on a client's id
+                if args['id'] in self._students:
+                    raise HTTPError(409, f"student {args['id']} exists already")
+                student.id = args['id']
+            self.ams.register_student(student)
+            self._students[student.id] = student
+            args['id'] = student.id
+            return {'id': student.id}, (student.id,), ()
+        if op == 'course':
+            if args['code'] in self._courses:
+                raise HTTPError(409, f"course {args['code']} exists already")
+            course = self.ams.create_course(Course(args['code'], args['name'], args['credits']))
+            self._courses[course.code] = course
+            return {'code': course.code}, (), (course.code,)
+        if op == 'enroll':
+            student, course = self._student(args['student']), self._course(args['course'])
+            course.enroll_student(student)
+            return {'courses': len(student.courses)}, (student.id,), (course.code,)
+        if op == 'grade':
+            student, course = self._student(args['student']), self._course(args['course'])
+            student.add_grade(course, args['grade'])
+            return {'gpa': student.calculate_gpa()}, (student.id,), ()
+        raise HTTPError(400, f"unknown operation {op}")
+
+    def _commit(self, batch):
+        """Apply a batch, journal it with one fsync and build the next snapshot (writer thread)"""
+        results = []
+        lines = []
+        changed_students = set()
+        changed_courses = set()
+        for op, args in batch:
+            try:
+                result, students, courses = self._apply(op, args)
+            except HTTPError as error:
+                results.append(error)
+                continue
+            except (KeyError, TypeError, ValueError) as error:
+                results.append(HTTPError(400, f"{type(error).__name__}: {error}"))
+                continue
+            results.append(result)
+            changed_students.update(students)
+            changed_courses.update(courses)
+            lines.append(json.dumps([op, args]) + '\n')
+        if lines and self._journal is not None:
+            try:
+                self._journal.write(''.join(lines))
+                self._journal.flush()
+                if self.sync:
+                    os.fsync(self._journal.fileno())
+            except OSError as error:
+                # the live objects have changed but are not durable: never
+                # publish them, take no more writes
+                self._failed = error
+                raise
+        old = self._snapshot
+        if not changed_students and not changed_courses:
+            return results, old
+        # copy on write: unchanged summaries are shared with the old snapshot
+        students = dict(old.students)
+        for sid in changed_students:
+            students[sid] = student_summary(self._students[sid])
+        courses = dict(old.courses)
+        for code in changed_courses:
+            courses[code] = course_summary(self._courses[code])
+        return results, Snapshot(old.version + 1, students, courses)
+
+    def _replay(self, journal_path):
+        with open(journal_path, encoding='utf-8') as f:
+            for line in f:
+                if line.endswith('\n'):
+                    op, args = json.loads(line)
+                    self._apply(op, args)
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._writes.get()
+            if item is None:
+                # queued by stop()
+                break
+            batch = [item]
+            while len(batch) < self.max_batch and not self._writes.empty():
+                item = self._writes.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if self._failed is not None:
+                results = [self._unavailable()] * len(batch)
+                snapshot = self._snapshot
+            else:
+                try:
+                    results, snapshot = await loop.run_in_executor(
+                        self._executor, self._commit, [(op, args) for op, args, _ in batch])
+                except Exception as error:
+                    results = [HTTPError(500, str(error))] * len(batch)
+                    snapshot = self._snapshot
+            self._publish(snapshot)
+            self.stats['batches'] += 1
+            self.stats['writes'] += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, HTTPError):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _publish(self, snapshot):
+        if snapshot is not self._snapshot:
+            self._snapshot = snapshot
+            self._responses = {}
+
+    def _unavailable(self):
+        if self._failed is not None:
+            return HTTPError(503, f"writes stopped, the journal failed: {self._failed}")
+        return HTTPError(503, "the service is stopping")
+
+    async def write(self, op, args):
+        """Queue a write, returns its result once it is committed"""
+        if self._failed is not None or self._stopping:
+            raise self._unavailable()
+        args = dict(args)
+        if op == 'register':
+            # ids are assigned by the system
+            args.pop('id', None)
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((op, args, future))
+        return await future
+
+    # -- reads --------------------------------------------------------------
+
+    def read(self, target):
+        """Encoded JSON answer of a GET request, from the current snapshot"""
+        self.stats['reads'] += 1
+        query = self._parse(target)
+        if self.coalesce:
+            body = self._responses.get(query)
+            if body is not None:
+                self.stats['coalesced'] += 1
+                return body
+        body = json.dumps(self._query(self._snapshot, query)).encode()
+        if self.coalesce and query[0] != 'stats':
+            if len(self._responses) >= self.max_cached:
+                # the oldest entry goes, dicts keep the insertion order
+                del self._responses[next(iter(self._responses))]
+            self._responses[query] = body
+        return body
+
+    def _parse(self, target):
+        """The normalized query of a GET target, e.g. ('top', 'Physics', 10)"""
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        if parts[0] == 'students' and len(parts) == 2:
+            return 'student', parts[1]
+        if parts[0] == 'students' and len(parts) == 3 and parts[2] == 'gpa':
+            return 'gpa', parts[1]
+        if parts[0] == 'courses' and len(parts) == 2:
+            return 'course', parts[1]
+        if parts[0] == 'programs' and len(parts) == 3 and parts[2] == 'top':
+            try:
+                k = int(parse_qs(url.query).get('k', ['10'])[0])
+            except ValueError:
+                raise HTTPError(400, "k must be a number") from None
+            return 'top', parts[1], max(k, 0)
+        if parts == ['stats']:
+            return 'stats',
+        raise HTTPError(404, f"unknown path {url.path}")
+
+    def _query(self, snapshot, query):
+        kind = query[0]
+        if kind in ('student', 'gpa'):
+            student = snapshot.students.get(query[1])
+            if student is None:
+                raise HTTPError(404, f"no student {query[1]}")
+            if kind == 'student':
+                return student
+            return {'id': student['id'], 'gpa': student['gpa']}
+        if kind == 'course':
+            course = snapshot.courses.get(query[1])
+            if course is None:
+                raise HTTPError(404, f"no course {query[1]}")
+            return course
+        if kind == 'top':
+            _, program, k = query
+            students = (s for s in snapshot.students.values() if s['program'] == program)
+            best = heapq.nlargest(k, students, key=lambda s: s['gpa'])
+            return [{'id': s['id'], 'name': s['name'], 'gpa': s['gpa']} for s in best]
+        # stats
+        return dict(self.stats, version=snapshot.version, students=len(snapshot.students),
+                    courses=len(snapshot.courses))
+
+    # -- HTTP ---------------------------------------------------------------
+
+    async def _dispatch(self, method, target, body):
+        try:
+            if method == 'GET':
+                return 200, self.read(target)
+            if method == 'POST':
+                op = _WRITE_OPERATIONS.get(urlsplit(target).path.strip('/'))
+                if op is None:
+                    raise HTTPError(404, f"unknown path {target}")
+                try:
+                    args = json.loads(body)
+                except ValueError:
+                    raise HTTPError(400, "body is not JSON") from None
+                if not isinstance(args, dict):
+                    raise HTTPError(400, "body must be a JSON object")
+                result = await self.write(op, args)
+                return (201 if op in ('register', 'course') else 200), json.dumps(result).encode()
+            raise HTTPError(405, f"method {method} not allowed")
+        except HTTPError as error:
+            return error.status, json.dumps({'error': error.message}).encode()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self._dispatch(method, target, body)
+                keep_alive = (version == 'HTTP/1.1'
+                              and headers.get('connection', '').lower() != 'close')
+                writer.write((f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                              f"Content-Type: application/json\r\n"
+                              f"Content-Length: {len(payload)}\r\n"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                              ).encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """Serve on a TCP port (0: any free one) or, with path, a Unix socket"""
+        self._writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()
+
+    async def stop(self):
+        """Stop serving; writes queued so far are committed (or failed) first"""
+        self._stopping = True
+        self._server.close()
+        await self._server.wait_closed()
+        await self._writes.put(None)
+        await self._writer
+        # writes of handlers which were still running get an answer as well
+        while not self._writes.empty():
+            item = self._writes.get_nowait()
+            if item is not None and not item[2].done():
+                item[2].set_exception(self._unavailable())
+        self._executor.shutdown()
+        if self._journal is not None:
+            self._journal.close()
+
+
+def build_demo_system(n_students=20000, n_courses=50, seed=1337):
+    """Students with predictable ids s0, s1, ... and courses C000, C001, ..."""
+    import random
+    rng = random.Random(seed)
+    programs = ["Computer Science", "Mathematics", "Physics", "Biology"]
+    ams = AcademicManagementSystem()
+    courses = [ams.create_course(Course(f"C{i:03d}", f"Course {i}", 3)) for i in range(n_courses)]
+    for i in range(n_students):
+        student = Student(f"Student {i}", 20, f"s{i}@example.com", rng.choice(programs))
+        student.id = f"s{i}"
+        ams.register_student(student)
+        for course in rng.sample(courses, 3):
+            course.enroll_student(student)
+            student.add_grade(course, rng.randint(50, 100))
+    return ams
+
+
+# -- load generator -----------------------------------------------------------
+
+def _serve(ready, options, n_students):
+    async def main():
+        service = AcademicService(build_demo_system(n_students), **options)
+        host, port = await service.start()
+        ready.put(port)
+        await asyncio.Event().wait()
+    asyncio.run(main())
+
+
+async def _client(host, port, n_requests, n_students, write_ratio, rng, latencies):
+    import time
+    reader, writer = await asyncio.open_connection(host, port)
+    programs = ["Computer%20Science", "Mathematics", "Physics", "Biology"]
+    for _ in range(n_requests):
+        sid = f"s{rng.randrange(n_students)}"
+        if rng.random() < write_ratio:
+            body = json.dumps({'student': sid, 'course': f"C{rng.randrange(50):03d}",
+                               'grade': rng.randint(50, 100)}).encode()
+            request = (f"POST /grades HTTP/1.1\r\nHost: {host}\r\n"
+                       f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+        else:
+            choice = rng.random()
+            if choice < 0.5:
+                path = f"/students/{sid}"
+            elif choice < 0.8:
+                path = f"/students/{sid}/gpa"
+            else:
+                path = f"/programs/{rng.choice(programs)}/top?k=10"
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+        start = time.perf_counter()
+        writer.write(request)
+        await writer.drain()
+        length = 0
+        status = await reader.readline()
+        while True:
+            line = await reader.readline()
+            if line == b'\r\n':
+                break
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        assert status.split()[1] in (b'200', b'201'), status
+    writer.close()
+
+
+async def load(host, port, connections=50, requests_per_connection=200, n_students=20000,
+               write_ratio=0.1, seed=1337):
+    """Run the clients, returns (requests per second, latencies in seconds)"""
+    import random
+    import time
+    latencies = []
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, requests_per_connection, n_students, write_ratio,
+                                   random.Random(rng.random()), latencies)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+if __name__ == '__main__':
+    import io
+    import multiprocessing
+    import tempfile
+
+    async def check_writes_and_cache():
+        service = AcademicService(build_demo_system(10), max_cached=4)
+        await service.start()
+        # a client can not pick (and so replace) the id of an existing student
+        result = await service.write('register', {'id': 's0', 'name': 'Eve', 'age': 20,
+                                                  'email': 'eve@example.com', 'program': 'Physics'})
+        assert result['id'] != 's0' and len(service.ams.students) == 11
+        assert service.ams.students[0].name == 'Student 0'
+        for i in range(100):
+            service.read(f"/programs/Physics/top?k=3&nonce={i}")
+        assert service.stats['coalesced'] == 99
+        for k in range(100):
+            service.read(f"/programs/Physics/top?k={k}")
+        assert len(service._responses) == 4
+        await service.stop()
+    asyncio.run(check_writes_and_cache())
+
+    class FullDisk(io.StringIO):
+        def write(self, text):
+            raise OSError(28, "No space left on device")
+
+    async def check_journal_failure_and_stop():
+        service = AcademicService(build_demo_system(10))
+        service._journal = FullDisk()
+        await service.start()
+        grade = {'student': 's0', 'course': 'C000', 'grade': 100}
+        for status in (500, 503):
+            try:
+                await service.write('grade', grade)
+            except HTTPError as error:
+                assert error.status == status
+        # the change of the failed batch is not visible
+        assert service._snapshot.version == 0
+        service._journal = None
+        service._failed = None
+        pending = [asyncio.ensure_future(service.write('grade', grade)) for _ in range(10)]
+        await asyncio.sleep(0)
+        await service.stop()
+        assert all(future.done() for future in pending)
+    asyncio.run(check_journal_failure_and_stop())
+
+    N_STUDENTS = 20000
+    configurations = [
+        ("one commit per write, no coalescing", {'max_batch': 1, 'coalesce': False}),
+        ("group commits and coalesced reads", {'max_batch': 256, 'coalesce': True}),
+    ]
+    for name, options in configurations:
+        with tempfile.TemporaryDirectory() as tmp:
+            options = dict(options, journal_path=os.path.join(tmp, 'academic.journal'))
+            ready = multiprocessing.Queue()
+            server = multiprocessing.Process(target=_serve, args=(ready, options, N_STUDENTS),
+                                             daemon=True)
+            server.start()
+            port = ready.get(timeout=120)
+            throughput, latencies = asyncio.run(load('127.0.0.1', port, n_students=N_STUDENTS))
+            server.terminate()
+            server.join()
+        print(f"{name}: {throughput:.0f} requests/s, latency p50 {percentile(latencies, 50) * 1e3:.2f} ms, "
+              f"p95 {percentile(latencies, 95) * 1e3:.2f} ms, p99 {percentile(latencies, 99) * 1e3:.2f} ms")
@@ -0,0 +1,361 @@
+"""
+Sharded call counters
+
+MathOperations in oop-notebook_1.py counts its calls in a class attribute:
+
+    cls.operation_count += 1
+
+which is a read, an add and a write. Two threads can read the same value and
+one of the increments is lost. A lock around it fixes that, but then every
+add() of every thread waits for the same lock.
+
+The counters below give every thread its own cell. Only the owning thread
+writes a cell, so incrementing needs no lock; reading the value adds up the
+cells of all threads:
+
+    @counted(attribute='operation_count')
+    class MathOperations:
+        @staticmethod
+        def add(x, y):
+            return x + y
+
+    MathOperations.add(5, 3)
+    MathOperations.operation_count          # 1
+
+SharedCounter does the same across processes: its cells live in a
+multiprocessing.shared_memory block, every thread of every process writes
+its own slot. Hand it to worker processes when they start (as an argument of
+Process or in the initargs of a Pool), its lock can not be pickled later.
+"""
+import functools
+import inspect
+import os
+import threading
+import weakref
+from multiprocessing import Lock as ProcessLock
+from multiprocessing import shared_memory
+
+
+class Counter:
+    """Counter with one cell per thread, incremented without locking"""
+    def __init__(self, name=None):
+        self.name = name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells = []        # (thread, cell) of the threads that counted
+        self._retired = 0       # counts of finished threads
+        self._base = 0          # value at the last reset
+
+    def _register(self):
+        cell = [0]
+        self._local.cell = cell
+        with self._lock:
+            self._cells.append((threading.current_thread(), cell))
+        return cell
+
+    def increment(self, n=1):
+        try:
+            self._local.cell[0] += n
+        except AttributeError:
+            self._register()[0] += n
+
+    def _total(self):
+        with self._lock:
+            alive = []
+            for thread, cell in self._cells:
+                if thread.is_alive():
+                    alive.append((thread, cell))
+                else:
+                    # the thread can not write anymore, keep its count only
+                    self._retired += cell[0]
+            self._cells = alive
+            return self._retired + sum(cell[0] for _, cell in alive)
+
+    @property
+    def value(self):
+        return self._total() - self._base
+
+    def __int__(self):
+        return self.value
+
+    def reset(self):
+        """Start counting from 0 again, the cells are not touched"""
+        self._base = self._total()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r}, value={self.value})"
+
+
+class SharedCounter:
+    """
+    Counter with one slot per thread and process in shared memory
+
+    Slot 0 holds the next free slot, the last slot is shared by threads which
+    find no free slot any more and is only written under the lock. Slots of
+    finished threads are reused by new threads of the same process; their
+    count simply continues.
+    """
+    def __init__(self, name=None, slots=256):
+        self.name = name
+        self.slots = slots
+        self._shm = shared_memory.SharedMemory(create=True, size=8 * (slots + 2))
+        self._owner = True
+        self._lock = ProcessLock()
+        self._attach()
+        self._cells[0] = 1
+
+    def _attach(self):
+        self._cells = self._shm.buf.cast('q')
+        self._forget_slots()
+        self._base = 0
+        _shared_counters.add(self)
+
+    def _forget_slots(self):
+        # also run in forked children: they must not keep writing the slots
+        # of the parent's threads
+        self._local = threading.local()
+        self._threads = []      # (thread, slot) of this process
+        self._thread_lock = threading.Lock()
+
+    def __getstate__(self):
+        return self.name, self.slots, self._shm.name, self._lock
+
+    def __setstate__(self, state):
+        self.name, self.slots, shm_name, self._lock = state
+        self._shm = shared_memory.SharedMemory(name=shm_name)
+        self._owner = False
+        self._attach()
+
+    def _register(self):
+        with self._thread_lock:
+            for i, (thread, slot) in enumerate(self._threads):
+                if not thread.is_alive():
+                    self._threads[i] = (threading.current_thread(), slot)
+                    break
+            else:
+                with self._lock:
+                    slot = self._cells[0]
+                    if slot <= self.slots:
+                        self._cells[0] = slot + 1
+                if slot > self.slots:
+                    return None
+                self._threads.append((threading.current_thread(), slot))
+        self._local.slot = slot
+        return slot
+
+    def increment(self, n=1):
+        try:
+            slot = self._local.slot
+        except AttributeError:
+            slot = self._register()
+        if slot is None:
+            with self._lock:
+                self._cells[self.slots + 1] += n
+        else:
+            self._cells[slot] += n
+
+    def _total(self):
+        cells = self._cells
+        return sum(cells[1:min(cells[0], self.slots + 1)]) + cells[self.slots + 1]
+
+    @property
+    def value(self):
+        return self._total() - self._base
+
+    def __int__(self):
+        return self.value
+
+    def reset(self):
+        """Start counting from 0 again in this process"""
+        self._base = self._total()
+
+    def close(self):
+        """Detach; the creating process also frees the shared memory"""
+        if self._cells is None:
+            return
+        self._cells.release()
+        self._cells = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r}, value={self.value})"
+
+
+# shared counters of this process, their slots are dropped after a fork
+_shared_counters = weakref.WeakSet()
+
+
+def _after_fork():
+    for counter in list(_shared_counters):
+        counter._forget_slots()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class CounterAttribute:
+    """Class attribute reading a counter, e.g. MathOperations.operation_count"""
+    def __init__(self, counter):
+        self.counter = counter
+
+    def __get__(self, instance, owner=None):
+        return self.counter.value
+
+
+def _count_function(func, counter):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        counter.increment()
+        return func(*args, **kwargs)
+    wrapper.counter = counter
+    return wrapper
+
+
+def _count(member, counter):
+    if isinstance(member, staticmethod):
+        return staticmethod(_count_function(member.__func__, counter))
+    if isinstance(member, classmethod):
+        return classmethod(_count_function(member.__func__, counter))
+    return _count_function(member, counter)
+
+
+def counted(target=None, *, counter=None, attribute='call_count'):
+    """
+    Count the calls of a function, staticmethod, classmethod or class
+
+    For a class, the calls of all its public methods go to one counter which
+    is readable as the class attribute `attribute`. The counter is also
+    available as .counter of every wrapped function.
+    """
+    def decorate(target):
+        count = counter if counter is not None else Counter(getattr(target, '__qualname__', None))
+        if not isinstance(target, type):
+            return _count(target, count)
+        for name, member in list(vars(target).items()):
+            if name.startswith('_'):
+                continue
+            function = member.__func__ if isinstance(member, (staticmethod, classmethod)) else member
+            # methods only: nested classes and other callables are left alone
+            if inspect.isfunction(function):
+                setattr(target, name, _count(member, count))
+        setattr(target, attribute, CounterAttribute(count))
+        return target
+
+    if target is not None:
+        return decorate(target)
+    return decorate
+
+
+@counted(attribute='operation_count')
+class MathOperations:
+    """MathOperations of oop-notebook_1.py, counted without a shared class attribute"""
+    @staticmethod
+    def add(x, y):
+        """Static method for addition"""
+        return x + y
+
+    @staticmethod
+    def multiply(x, y):
+        """Static method for multiplication"""
+        return x * y
+
+
+def _shared_worker(counter, n):
+    for _ in range(n):
+        counter.increment()
+
+
+if __name__ == '__main__':
+    import time
+    from multiprocessing import Process
+
+    print(MathOperations.add(5, 3))
+    print(MathOperations.multiply(4, 6))
+    print(f"Total operations: {MathOperations.operation_count}")
+
+    @counted
+    class Shapes:
+        class Square:
+            pass
+
+        def area(self, side):
+            return side * side
+    assert isinstance(Shapes.Square(), Shapes.Square) and Shapes.call_count == 0
+    Shapes().area(2)
+    assert Shapes.call_count == 1
+
+    class AttributeCounter:
+        # the notebook's cls.operation_count += 1
+        operation_count = 0
+
+        @classmethod
+        def increment(cls):
+            cls.operation_count += 1
+
+    class LockedCounter:
+        def __init__(self):
+            self.value = 0
+            self.lock = threading.Lock()
+
+        def increment(self):
+            with self.lock:
+                self.value += 1
+
+    N = 1000000
+    MAX_THREADS = max(4, os.cpu_count() or 1)
+
+    def run_threads(increment, threads, per_thread):
+        workers = [threading.Thread(target=lambda: [increment() for _ in range(per_thread)])
+                   for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - start
+
+    print("\nincrements per second, total", N)
+    print("threads  attribute (lost)       lock       sharded")
+    threads = 1
+    while threads <= MAX_THREADS:
+        per_thread = N // threads
+        AttributeCounter.operation_count = 0
+        t_attribute = run_threads(AttributeCounter.increment, threads, per_thread)
+        lost = per_thread * threads - AttributeCounter.operation_count
+        locked = LockedCounter()
+        t_lock = run_threads(locked.increment, threads, per_thread)
+        sharded = Counter()
+        t_sharded = run_threads(sharded.increment, threads, per_thread)
+        assert sharded.value == locked.value == per_thread * threads
+        print(f"{threads:7d}  {N / t_attribute:9.0f} ({lost:4d})  {N / t_lock:10.0f}  {N / t_sharded:12.0f}")
+        threads *= 2
+
+    print("\nshared memory counter across processes")
+    with SharedCounter('shared') as shared:
+        # the parent counts first: forked workers must not inherit its slot
+        shared.increment()
+        shared.reset()
+        processes = 1
+        while processes <= MAX_THREADS:
+            shared.reset()
+            per_process = N // processes
+            workers = [Process(target=_shared_worker, args=(shared, per_process))
+                       for _ in range(processes)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            assert shared.value == per_process * processes
+            print(f"{processes:7d} processes  {N / elapsed:10.0f} increments per second")
+            processes *= 2
@@ -0,0 +1,463 @@
+"""
+Thread-safe ledger for BankAccount
+
+BankAccount in oop-notebook_1.py keeps its balance in an attribute: two
+threads depositing at the same time can lose one of the updates, nothing
+records what happened, and a million transactions are a million method
+calls. The Ledger keeps the balances of all accounts:
+
+    ledger = Ledger('bank.journal')
+    alice = ledger.open_account("Alice", 1000)
+    ledger.deposit(alice, 500)
+    ledger.withdraw(alice, 2000)            # False, like BankAccount.withdraw
+    ledger.apply_batch(transactions)        # NumPy array of (account, amount)
+
+- amounts are integers in the smallest currency unit (cents), so sums are
+  exact; withdrawals are negative amounts in batches
+- accounts are striped over `shards` locks, threads working on accounts of
+  different shards do not wait for each other. Transfers lock both shards in
+  a fixed order
+- every applied transaction is appended to a binary journal; rejected ones
+  are not. Appends are collected in a buffer and written in groups; flush()
+  (and close()) make them durable, with sync=True also through fsync
+- every snapshot_every transactions the balances are written to a snapshot
+  file next to the journal. Opening a ledger on an existing journal loads
+  the snapshot and only replays the journal after it
+- apply_batch checks the overdrafts of a whole array at once: it computes
+  the running balance of every account with cumulative sums and only goes
+  through the transactions of accounts that would be overdrawn one by one,
+  so the result is the same as applying them in order
+
+BankAccount below is the class of the notebook on top of a ledger.
+"""
+import json
+import os
+import struct
+import threading
+from array import array
+from contextlib import contextmanager, nullcontext
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# journal record: kind, account, other account / length, amount
+_RECORD = struct.Struct('<Bqqq')
+_PAIR = struct.Struct('<qq')
+_SNAPSHOT = struct.Struct('<qqq')   # journal offset, accounts, length of the owners
+
+OPEN, DELTA, TRANSFER, BATCH = range(4)
+
+
+class _Journal:
+    """Append-only file with a write buffer, writes are grouped"""
+    def __init__(self, path, sync=False, buffer_size=1 << 20):
+        self.path = path
+        self.sync = sync
+        self.buffer_size = buffer_size
+        self.file = open(path, 'ab')
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.since_snapshot = 0
+
+    def append(self, data, records=1):
+        with self.lock:
+            self.buffer += data
+            self.since_snapshot += records
+            if len(self.buffer) >= self.buffer_size:
+                self._write()
+
+    def _write(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def flush(self):
+        """Write the buffer to the file, return the end of the journal"""
+        with self.lock:
+            self._write()
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+            return self.file.tell()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def _check_overdrafts(balances, accounts, amounts):
+    """
+    Mask of the transactions which are accepted when applied in order
+
+    A transaction is rejected if its amount is 0 or it would make the balance
+    of its account negative.
+    """
+    accepted = amounts != 0
+    if not len(accounts):
+        return accepted
+    # the transactions of every account next to each other, in their order
+    order = np.argsort(accounts, kind='stable')
+    acc = accounts[order]
+    amt = np.where(accepted[order], amounts[order], 0)
+    is_start = np.empty(len(acc), dtype=bool)
+    is_start[0] = True
+    np.not_equal(acc[1:], acc[:-1], out=is_start[1:])
+    starts = np.flatnonzero(is_start)
+    group = np.cumsum(is_start) - 1
+    # running balance after each transaction, cumulative sums per account
+    csum = np.cumsum(amt)
+    running = balances[acc] + csum - (csum[starts] - amt[starts])[group]
+    ends = np.append(starts[1:], len(acc))
+    for g in np.unique(group[running < 0]):
+        # an overdraft: reject withdrawals one by one, later ones may fit again
+        start, end = starts[g], ends[g]
+        balance = int(balances[acc[start]])
+        for i in range(start, end):
+            amount = int(amt[i])
+            if balance + amount < 0:
+                accepted[order[i]] = False
+            else:
+                balance += amount
+    return accepted
+
+
+class Ledger:
+    """Balances of many accounts, safe to use from several threads"""
+    def __init__(self, journal_path=None, shards=64, snapshot_every=1000000, sync=False):
+        self._balances = array('q')
+        self._owners = []
+        self._shards = [threading.Lock() for _ in range(shards)]
+        # account creation and whole-ledger operations
+        self._open_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self.snapshot_every = snapshot_every
+        self.journal_path = journal_path
+        self._journal = None
+        if journal_path is not None:
+            if os.path.exists(journal_path):
+                self._recover()
+            self._journal = _Journal(journal_path, sync)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._balances)
+
+    def _check(self, account):
+        if not 0 <= account < len(self._balances):
+            raise KeyError(f"no account {account}")
+
+    def _lock(self, account):
+        return self._shards[account % len(self._shards)]
+
+    @contextmanager
+    def _all_locks(self):
+        with self._open_lock:
+            for lock in self._shards:
+                lock.acquire()
+            try:
+                yield
+            finally:
+                for lock in self._shards:
+                    lock.release()
+
+    def _log(self, kind, account, other, amount, payload=b''):
+        if self._journal is not None:
+            self._journal.append(_RECORD.pack(kind, account, other, amount) + payload)
+
+    def _maybe_snapshot(self):
+        journal = self._journal
+        if journal is not None and journal.since_snapshot >= self.snapshot_every:
+            if self._snapshot_lock.acquire(blocking=False):
+                try:
+                    self._write_snapshot()
+                finally:
+                    self._snapshot_lock.release()
+
+    # -- transactions -------------------------------------------------------
+
+    def open_account(self, owner, balance=0):
+        """Create an account, returns its number"""
+        if balance < 0:
+            raise ValueError("Balance cannot be negative")
+        owner_bytes = owner.encode()
+        with self._open_lock:
+            account = len(self._balances)
+            self._balances.append(balance)
+            self._owners.append(owner)
+            self._log(OPEN, account, len(owner_bytes), balance, owner_bytes)
+        return account
+
+    def owner(self, account):
+        self._check(account)
+        return self._owners[account]
+
+    def balance(self, account):
+        self._check(account)
+        return self._balances[account]
+
+    def deposit(self, account, amount):
+        self._check(account)
+        if amount <= 0:
+            return False
+        with self._lock(account):
+            self._balances[account] += amount
+            self._log(DELTA, account, 0, amount)
+        self._maybe_snapshot()
+        return True
+
+    def withdraw(self, account, amount):
+        self._check(account)
+        if amount <= 0:
+            return False
+        with self._lock(account):
+            if amount > self._balances[account]:
+                return False
+            self._balances[account] -= amount
+            self._log(DELTA, account, 0, -amount)
+        self._maybe_snapshot()
+        return True
+
+    def set_balance(self, account, value):
+        """The balance setter of BankAccount, recorded as a correction"""
+        self._check(account)
+        if value < 0:
+            raise ValueError("Balance cannot be negative")
+        with self._lock(account):
+            delta = value - self._balances[account]
+            self._balances[account] = value
+            self._log(DELTA, account, 0, delta)
+        self._maybe_snapshot()
+
+    def transfer(self, source, target, amount):
+        """Move amount between two accounts, False if source would be overdrawn"""
+        self._check(source)
+        self._check(target)
+        if amount <= 0 or source == target:
+            return False
+        first, second = sorted((self._lock(source), self._lock(target)), key=id)
+        with first:
+            with (second if second is not first else nullcontext()):
+                if amount > self._balances[source]:
+                    return False
+                self._balances[source] -= amount
+                self._balances[target] += amount
+                self._log(TRANSFER, source, target, amount)
+        self._maybe_snapshot()
+        return True
+
+    def apply_batch(self, transactions):
+        """
+        Apply an array of (account, amount) rows in order, returns the mask of accepted rows
+
+        Positive amounts are deposits, negative ones withdrawals; a withdrawal
+        that would overdraw its account is rejected, as by withdraw(). The
+        whole ledger is locked while the batch is applied.
+        """
+        if np is None:
+            raise ImportError("apply_batch needs numpy")
+        transactions = np.ascontiguousarray(transactions, dtype=np.int64)
+        if transactions.ndim != 2 or transactions.shape[1] != 2:
+            raise ValueError("transactions must be an array of (account, amount) rows")
+        accounts, amounts = transactions[:, 0], transactions[:, 1]
+        with self._all_locks():
+            if len(accounts) and (accounts.min() < 0 or accounts.max() >= len(self._balances)):
+                raise KeyError("batch refers to accounts which do not exist")
+            # a view on the balances, no copy; dropped before the array may grow again
+            balances = np.frombuffer(self._balances, dtype=np.int64)
+            try:
+                accepted = _check_overdrafts(balances, accounts, amounts)
+                np.add.at(balances, accounts[accepted], amounts[accepted])
+            finally:
+                del balances
+            if self._journal is not None:
+                applied = transactions[accepted]
+                self._journal.append(_RECORD.pack(BATCH, len(applied), 0, 0) + applied.tobytes(),
+                                     records=len(applied))
+        self._maybe_snapshot()
+        return accepted
+
+    def total(self):
+        """Sum of all balances, consistent across accounts"""
+        with self._all_locks():
+            return sum(self._balances)
+
+    # -- journal and snapshots ----------------------------------------------
+
+    def flush(self):
+        """Make all applied transactions durable"""
+        if self._journal is not None:
+            self._journal.flush()
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def snapshot(self):
+        """Write the balances to the snapshot file, recovery starts from there"""
+        if self._journal is None:
+            raise ValueError("a ledger without journal has no snapshots")
+        with self._snapshot_lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        with self._all_locks():
+            offset = self._journal.flush()
+            self._journal.since_snapshot = 0
+            balances = self._balances.tobytes()
+            owners = json.dumps(self._owners).encode()
+        # the (slow) writing happens after the ledger is unlocked again
+        path = self.journal_path + '.snapshot'
+        with open(path + '.tmp', 'wb') as f:
+            f.write(_SNAPSHOT.pack(offset, len(balances) // 8, len(owners)))
+            f.write(balances)
+            f.write(owners)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _recover(self):
+        offset = 0
+        path = self.journal_path + '.snapshot'
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                offset, n_accounts, owners_length = _SNAPSHOT.unpack(f.read(_SNAPSHOT.size))
+                self._balances.frombytes(f.read(8 * n_accounts))
+                self._owners = json.loads(f.read(owners_length))
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        balances = self._balances
+        pos = 0
+        while pos + _RECORD.size <= len(data):
+            kind, account, other, amount = _RECORD.unpack_from(data, pos)
+            end = pos + _RECORD.size
+            if kind == DELTA:
+                balances[account] += amount
+            elif kind == TRANSFER:
+                balances[account] -= amount
+                balances[other] += amount
+            elif kind == OPEN:
+                end += other
+                if end > len(data):
+                    break
+                balances.append(amount)
+                self._owners.append(data[end - other:end].decode())
+            elif kind == BATCH:
+                end += account * _PAIR.size
+                if end > len(data):
+                    break
+                for target, value in _PAIR.iter_unpack(data[pos + _RECORD.size:end]):
+                    balances[target] += value
+            else:
+                raise ValueError(f"corrupt journal record at byte {offset + pos}")
+            pos = end
+        if pos < len(data):
+            # a record torn by a crash while it was written
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(offset + pos)
+
+
+# ledger of BankAccount objects created without one
+default_ledger = Ledger()
+
+
+class BankAccount:
+    """BankAccount of oop-notebook_1.py, its balance kept in a Ledger"""
+    def __init__(self, owner, balance=0, ledger=None):
+        self._ledger = ledger or default_ledger
+        self._account = self._ledger.open_account(owner, balance)
+
+    @property
+    def balance(self):
+        return self._ledger.balance(self._account)
+
+    @property
+    def owner(self):
+        return self._ledger.owner(self._account)
+
+    @balance.setter
+    def balance(self, value):
+        self._ledger.set_balance(self._account, value)
+
+    def deposit(self, amount):
+        return self._ledger.deposit(self._account, amount)
+
+    def withdraw(self, amount):
+        return self._ledger.withdraw(self._account, amount)
+
+
+if __name__ == '__main__':
+    import random
+    import tempfile
+    import time
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    account = BankAccount("Alice", 1000)
+    print(f"Owner: {account.owner}")
+    account.deposit(500)
+    print(account.withdraw(2000), account.balance)
+
+    ACCOUNTS, N, THREADS = 10000, 1000000, 4
+    rng = random.Random(1337)
+    transactions = [(rng.randrange(ACCOUNTS), rng.randint(-500, 500)) for _ in range(N)]
+
+    def run(ledger, rows):
+        for number, amount in rows:
+            if amount > 0:
+                ledger.deposit(number, amount)
+            else:
+                ledger.withdraw(number, -amount)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bank.journal')
+        with Ledger(path, snapshot_every=200000) as ledger:
+            for i in range(ACCOUNTS):
+                ledger.open_account(f"owner {i}", 1000)
+            benchmark(lambda: run(ledger, transactions), f"{N} transactions, 1 thread")
+
+            threads = [threading.Thread(target=run, args=(ledger, transactions[i::THREADS]))
+                       for i in range(THREADS)]
+            def threaded():
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            benchmark(threaded, f"{N} transactions, {THREADS} threads")
+
+            if np is not None:
+                batch = np.array(transactions, dtype=np.int64)
+                accepted = benchmark(lambda: ledger.apply_batch(batch), f"{N} transactions as a batch")
+                print(f"{accepted.mean():.1%} accepted")
+                # the batch gives the same balances as the loop
+                check = Ledger()
+                for i in range(ACCOUNTS):
+                    check.open_account(f"owner {i}", 1000)
+                run(check, transactions)
+                check_batch = Ledger()
+                for i in range(ACCOUNTS):
+                    check_batch.open_account(f"owner {i}", 1000)
+                check_batch.apply_batch(batch)
+                assert list(check._balances) == list(check_batch._balances)
+            expected = list(ledger._balances)
+            assert min(expected) >= 0
+
+        recovered = benchmark(lambda: Ledger(path), "recovery from snapshot and journal")
+        assert list(recovered._balances) == expected
+        recovered.close()
+        os.remove(path + '.snapshot')
+        recovered = benchmark(lambda: Ledger(path), "recovery from the journal only")
+        assert list(recovered._balances) == expected
+        recovered.close()
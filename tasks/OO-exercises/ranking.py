@@ -0,0 +1,347 @@
+"""
+Top-k and ranking queries over students
+
+"The 100 best students of a program" means calculate_gpa() for every
+Student of AcademicManagementSystem.students and sorting them all, for every
+report. StudentRanking keeps the students ordered by GPA instead, overall,
+per program and per department, and moves a student when add_grade changes
+its GPA (through the listeners of student_management.Observable):
+
+    ranking = StudentRanking(ams)
+    ranking.top(100, program="Computer Science")
+    ranking.percentile(student, department="Computer Science")
+    ranking.lowest_courses(5)
+
+Each ranking is a sorted list of (-GPA, sequence number) keys searched with
+bisect: top-k reads k items, rank and percentile are binary searches
+(O(log n)), moving a student is two searches plus moving the list tail.
+Course averages are ranked the same way.
+
+A ranking listens to the management systems it tracks, their departments
+and the ranked students until close() is called: students registered or
+added to a department later are ranked as well.
+"""
+import bisect
+import itertools
+
+from student_management import Department
+
+_INF = float('inf')
+
+
+class _SortedRanking:
+    """Items ordered by score, best first; ties in the order they were added"""
+    def __init__(self):
+        self._keys = []         # (-score, seq), sorted
+        self._items = []        # same positions as _keys
+        self._key_of = {}       # id(item) -> key
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, item):
+        return id(item) in self._key_of
+
+    def insert(self, item, score, seq):
+        key = (-score, seq)
+        i = bisect.bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._items.insert(i, item)
+        self._key_of[id(item)] = key
+
+    def extend(self, entries):
+        """Add many (item, score, seq) entries with one sort"""
+        pairs = list(zip(self._keys, self._items))
+        for item, score, seq in entries:
+            key = (-score, seq)
+            pairs.append((key, item))
+            self._key_of[id(item)] = key
+        # seq numbers are unique, the items themselves are never compared
+        pairs.sort(key=lambda pair: pair[0])
+        self._keys = [key for key, _ in pairs]
+        self._items = [item for _, item in pairs]
+
+    def remove(self, item):
+        key = self._key_of.pop(id(item))
+        i = bisect.bisect_left(self._keys, key)
+        del self._keys[i]
+        del self._items[i]
+        return key
+
+    def update(self, item, score):
+        _, seq = self.remove(item)
+        self.insert(item, score, seq)
+
+    def score(self, item):
+        return -self._key_of[id(item)][0]
+
+    def top(self, k):
+        return self._items[:max(k, 0)]
+
+    def bottom(self, k):
+        return self._items[:-k - 1:-1] if k > 0 else []
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __reversed__(self):
+        return reversed(self._items)
+
+    def rank(self, item):
+        """1 for the best; equal scores share the better rank"""
+        score = -self._key_of[id(item)][0]
+        return bisect.bisect_left(self._keys, (-score,)) + 1
+
+    def percentile(self, item):
+        """Percentage of items scoring lower, counting equal ones half"""
+        score = -self._key_of[id(item)][0]
+        better = bisect.bisect_left(self._keys, (-score,))
+        not_worse = bisect.bisect_right(self._keys, (-score, _INF))
+        below = len(self._keys) - not_worse
+        return 100.0 * (below + 0.5 * (not_worse - better)) / len(self._keys)
+
+
+class _CourseStats:
+    __slots__ = ('code', 'total', 'count')
+
+    def __init__(self, code):
+        self.code = code
+        self.total = 0
+        self.count = 0
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class StudentRanking:
+    """GPA rankings of students overall, per program and per department"""
+    def __init__(self, ams=None):
+        self._seq = itertools.count()
+        self._all = _SortedRanking()
+        self._programs = {}         # program -> _SortedRanking
+        self._departments = {}      # department name -> _SortedRanking
+        self._groups = {}           # id(student) -> rankings the student is in
+        self._courses = _SortedRanking()
+        self._course_stats = {}     # course code -> _CourseStats
+        self._sources = {}          # id -> system, department or student listened to
+        if ams is not None:
+            self.track(ams)
+
+    def close(self):
+        """Stop following the tracked systems, departments and students"""
+        for source in self._sources.values():
+            source.remove_listener(self._on_event)
+        self._sources = {}
+
+    def _listen(self, source):
+        if id(source) not in self._sources:
+            source.add_listener(self._on_event)
+            self._sources[id(source)] = source
+
+    def _forget(self, source):
+        if self._sources.pop(id(source), None) is not None:
+            source.remove_listener(self._on_event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._all)
+
+    def track(self, ams):
+        """Add all students of a management system with their departments, and the ones to come"""
+        self._listen(ams)
+        departments = {}
+        for department in ams.departments:
+            self._listen(department)
+            for student in department.students:
+                departments.setdefault(id(student), []).append(department)
+        # collected first and sorted once per ranking
+        pending = {}
+        for student in ams.students:
+            if id(student) not in self._groups:
+                for group, entry in self._entries(student, departments.get(id(student), ())):
+                    pending.setdefault(id(group), (group, []))[1].append(entry)
+        for group, entries in pending.values():
+            group.extend(entries)
+
+    def _entries(self, student, departments):
+        groups = [self._all, self._programs.setdefault(student.program, _SortedRanking())]
+        for department in departments:
+            groups.append(self._departments.setdefault(department.name, _SortedRanking()))
+        self._groups[id(student)] = groups
+        self._listen(student)
+        for code, grade in student.grades.items():
+            self._course_grade(code, None, grade)
+        entry = (student, student.calculate_gpa(), next(self._seq))
+        return [(group, entry) for group in groups]
+
+    def add_student(self, student, departments=()):
+        """Rank a student in its program and the given departments"""
+        if student in self._all:
+            raise ValueError(f"student {student.name} is ranked already")
+        for group, entry in self._entries(student, departments):
+            group.insert(*entry)
+
+    def add_to_department(self, student, department):
+        """Rank a student in one more department"""
+        ranking = self._departments.setdefault(department.name, _SortedRanking())
+        if student not in ranking:
+            ranking.insert(student, self._all.score(student), next(self._seq))
+            self._groups[id(student)].append(ranking)
+
+    def remove_student(self, student):
+        self._forget(student)
+        for group in self._groups.pop(id(student)):
+            group.remove(student)
+        for code, grade in student.grades.items():
+            self._course_grade(code, grade, None)
+
+    def _on_event(self, source, event, *args):
+        if event == 'grade':
+            self._on_grade(source, *args)
+        elif event == 'department':
+            department, = args
+            self._listen(department)
+            for student in department.students:
+                self._on_member(department, student)
+        elif event == 'student':
+            student, = args
+            if isinstance(source, Department):
+                self._on_member(source, student)
+            elif student not in self._all:
+                self.add_student(student)
+
+    def _on_member(self, department, student):
+        if student in self._all:
+            self.add_to_department(student, department)
+        else:
+            self.add_student(student, (department,))
+
+    def _on_grade(self, student, course, previous, grade):
+        groups = self._groups.get(id(student))
+        if groups is None:
+            return
+        gpa = student.calculate_gpa()
+        for group in groups:
+            group.update(student, gpa)
+        self._course_grade(course.code, previous, grade)
+
+    def _course_grade(self, code, previous, grade):
+        stats = self._course_stats.get(code)
+        if stats is None:
+            stats = self._course_stats[code] = _CourseStats(code)
+            self._courses.insert(stats, 0.0, next(self._seq))
+        if previous is not None:
+            stats.total -= previous
+            stats.count -= 1
+        if grade is not None:
+            stats.total += grade
+            stats.count += 1
+        self._courses.update(stats, stats.average)
+
+    # -- queries ------------------------------------------------------------
+
+    def _ranking(self, program=None, department=None):
+        if program is not None and department is not None:
+            raise ValueError("rank by program or by department, not both")
+        if program is not None:
+            return self._programs.get(program) or _SortedRanking()
+        if department is not None:
+            return self._departments.get(department) or _SortedRanking()
+        return self._all
+
+    def top(self, k, program=None, department=None):
+        """The k students with the highest GPA, best first"""
+        return self._ranking(program, department).top(k)
+
+    def bottom(self, k, program=None, department=None):
+        """The k students with the lowest GPA, lowest first"""
+        return self._ranking(program, department).bottom(k)
+
+    def gpa(self, student):
+        return self._all.score(student)
+
+    def rank(self, student, program=None, department=None):
+        return self._ranking(program, department).rank(student)
+
+    def percentile(self, student, program=None, department=None):
+        return self._ranking(program, department).percentile(student)
+
+    def lowest_courses(self, k):
+        """(course code, average grade) of the k courses with the lowest averages"""
+        graded = (stats for stats in reversed(self._courses) if stats.count)
+        return [(stats.code, stats.average) for stats in itertools.islice(graded, k)]
+
+    def best_courses(self, k):
+        graded = (stats for stats in self._courses if stats.count)
+        return [(stats.code, stats.average) for stats in itertools.islice(graded, k)]
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    from student_management import AcademicManagementSystem, Course, Student
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    rng = random.Random(1337)
+    programs = ["Computer Science", "Mathematics", "Physics", "Biology", "Chemistry"]
+    ams = AcademicManagementSystem()
+    departments = {p: ams.create_department(Department(p, f"Dr. {p[0]}")) for p in programs}
+    courses = [ams.create_course(Course(f"C{i:03d}", f"Course {i}", 3), departments[programs[i % 5]])
+               for i in range(100)]
+    for i in range(50000):
+        program = rng.choice(programs)
+        student = ams.register_student(Student(f"Student {i}", 20, f"s{i}@example.com", program))
+        departments[program].add_student(student)
+        for course in rng.sample(courses, 4):
+            course.enroll_student(student)
+            student.add_grade(course, rng.randint(40, 100))
+
+    def sorted_reports():
+        return {p: sorted((s for s in ams.students if s.program == p),
+                          key=Student.calculate_gpa, reverse=True)[:100] for p in programs}
+
+    ranking = benchmark(lambda: StudentRanking(ams), f"ranking {len(ams.students)} students")
+    expected = benchmark(sorted_reports, "top 100 per program by sorting")
+    reports = benchmark(lambda: {p: ranking.top(100, program=p) for p in programs},
+                        "top 100 per program from the ranking")
+    assert all([s.calculate_gpa() for s in reports[p]] == [s.calculate_gpa() for s in expected[p]]
+               for p in programs)
+
+    def new_grades():
+        for student in rng.sample(ams.students, 10000):
+            course = rng.choice(student.courses)
+            student.add_grade(course, rng.randint(40, 100))
+    benchmark(new_grades, "10000 add_grade calls with ranking updates")
+
+    best = ranking.top(1)[0]
+    print(f"best: {best.name}, GPA {ranking.gpa(best):.2f}, "
+          f"percentile in {best.program}: {ranking.percentile(best, program=best.program):.1f}")
+    student = ams.students[0]
+    print(f"{student.name}: rank {ranking.rank(student)} of {len(ranking)}, "
+          f"percentile {ranking.percentile(student, department=student.program):.1f}")
+    print("lowest courses:", [(code, round(avg, 1)) for code, avg in ranking.lowest_courses(3)])
+    assert sorted(s.calculate_gpa() for s in ams.students)[::-1][:50] == \
+        [ranking.gpa(s) for s in ranking.top(50)]
+
+    # registered after the ranking was built
+    late = ams.register_student(Student("Late Student", 20, "late@example.com", "Physics"))
+    departments["Physics"].add_student(late)
+    late.add_grade(courses[0], 100)
+    assert ranking.rank(late, department="Physics") == 1
+    assert len(ranking) == len(ams.students)
+    ranking.close()
+    late.add_grade(courses[0], 0)
+    assert ranking.gpa(late) == 4.0
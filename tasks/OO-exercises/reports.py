@@ -0,0 +1,116 @@
+"""
+Streaming reports for the Student Management System
+
+Printing display_info() of every entity, or adding the texts up to one big
+report string, keeps the whole report in memory (and with += on a shared
+string costs quadratic time, see code/ntbks/01_intro/string_builder.py).
+The renderer below writes the text of one entity after the other to a file,
+collecting the pieces in a list (the StringBuilder idea of string_builder.py)
+that is written out batch by batch, so the file is not written per line.
+
+    with open('report.txt', 'w') as f:
+        render_registry(ams, f)
+"""
+BATCH_SIZE = 1 << 16
+
+
+def iter_report(entities, separator='\n\n'):
+    """Yield the display_info text of every entity, one at a time"""
+    first = True
+    for entity in entities:
+        if not first:
+            yield separator
+        first = False
+        yield entity.display_info()
+
+
+def render_report(entities, file, title=None, separator='\n\n', batch_size=BATCH_SIZE):
+    """
+    Write the display_info of all entities to an open text file
+
+    The texts are collected in a list which is written out and cleared every
+    batch_size characters, so memory use does not depend on the number of
+    entities. Returns the number of characters written.
+    """
+    parts = []
+    size = 0
+    written = 0
+    if title:
+        parts.append(f"{title}\n{'=' * len(title)}\n\n")
+        size += len(parts[-1])
+    for text in iter_report(entities, separator):
+        parts.append(text)
+        size += len(text)
+        if size >= batch_size:
+            file.writelines(parts)
+            written += size
+            parts.clear()
+            size = 0
+    parts.append('\n')
+    file.writelines(parts)
+    return written + size + 1
+
+
+def render_registry(ams, file, batch_size=BATCH_SIZE):
+    """Report of all departments, courses and students of a management system"""
+    if isinstance(file, str):
+        with open(file, 'w') as f:
+            return render_registry(ams, f, batch_size)
+    written = 0
+    for title, entities in (("Departments", ams.departments),
+                            ("Courses", ams.courses),
+                            ("Students", ams.students)):
+        written += render_report(entities, file, title, batch_size=batch_size)
+        file.write('\n')
+        written += 1
+    return written
+
+
+if __name__ == '__main__':
+    import io
+    import os
+    import random
+    import tempfile
+    import time
+
+    from student_management import AcademicManagementSystem, Course, Department, Student
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        result = function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format(end - start, function_name))
+        return result
+
+    ams = AcademicManagementSystem()
+    dept = ams.create_department(Department("Computer Science", "Dr. Smith"))
+    courses = [ams.create_course(Course(f"CS{i:03d}", f"Course {i}", 3), dept) for i in range(20)]
+    rng = random.Random(1337)
+    for i in range(20000):
+        student = ams.register_student(Student(f"Student {i}", 20, f"s{i}@example.com",
+                                               "Computer Science"))
+        for course in rng.sample(courses, 3):
+            course.enroll_student(student)
+            student.add_grade(course, rng.randint(50, 100))
+
+    class Registry:
+        pass
+
+    def plus_equals():
+        # the whole report built up in an attribute, then written
+        registry = Registry()
+        registry.report = ''
+        for student in ams.students:
+            registry.report += student.display_info() + '\n\n'
+        return registry.report
+
+    def streamed():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.txt')
+            render_registry(ams, path)
+            return os.path.getsize(path)
+
+    benchmark(plus_equals, "report with += on an attribute")
+    size = benchmark(streamed, "streamed report")
+    print(f"{size / 1e6:.1f} MB written")
+    print(render_report(ams.students[:2], io.StringIO()), "characters for two students")
@@ -0,0 +1,592 @@
+"""
+Pooled resource management
+
+`ResourceManager` from oop-notebook_2.py acquires a fresh resource for every
+`with` block and throws it away again on exit. For real resources (file
+handles, database connections, sockets) the setup cost dominates, so this
+module keeps a pool of resources and hands them out again and again behind
+the same context manager protocol:
+
+    pool = ResourcePool(open_connection, min_size=2, max_size=10)
+
+    with pool.resource() as conn:           # threads
+        ...
+
+    async with pool.resource() as conn:     # asyncio
+        ...
+"""
+import asyncio
+import contextlib
+import inspect
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no resource becomes available in time"""
+
+
+class PoolClosed(Exception):
+    """Raised when a closed pool is used"""
+
+
+class PoolMetrics:
+    """Counters describing how a pool is used"""
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.created = 0
+        self.destroyed = 0
+        self.evicted = 0
+        self.failed_health_checks = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # integral of the number of resources in use over time,
+        # used for the time averaged utilization
+        self._busy_area = 0.0
+        self._started = time.perf_counter()
+
+    def record_wait(self, seconds):
+        self.checkouts += 1
+        self.total_wait += seconds
+        if seconds > self.max_wait:
+            self.max_wait = seconds
+
+    @property
+    def mean_wait(self):
+        if not self.checkouts:
+            return 0.0
+        return self.total_wait / self.checkouts
+
+
+class PooledResource:
+    """Context manager lending one resource of a pool (sync and async)"""
+    def __init__(self, pool, timeout=None):
+        self.pool = pool
+        self.timeout = timeout
+        self.resource = None
+
+    def __enter__(self):
+        self.resource = self.pool.acquire(self.timeout)
+        return self.resource
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pool.release(self.resource)
+        self.resource = None
+        # never suppress errors of the caller
+        return False
+
+    async def __aenter__(self):
+        self.resource = await self.pool.acquire_async(self.timeout)
+        return self.resource
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.pool.release_async(self.resource)
+        self.resource = None
+        return False
+
+
+class ResourcePool:
+    """
+    Thread safe and asyncio aware pool of reusable resources
+
+    factory       -- creates a new resource (may be a coroutine function
+                     when the pool is only used with the async API)
+    min_size      -- resources kept alive even when idle
+    max_size      -- upper limit of resources alive at the same time
+    max_idle      -- seconds after which idle resources above min_size
+                     are closed, None keeps them forever
+    health_check  -- called on checkout, a falsy result or an exception
+                     discards the resource and a new one is handed out;
+                     a coroutine function needs acquire_async
+    close         -- called to dispose of a resource (a plain function)
+    """
+    def __init__(self, factory, min_size=0, max_size=10, max_idle=60.0,
+                 health_check=None, close=None, prefill=True):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if not 0 <= min_size <= max_size:
+            raise ValueError("min_size must be between 0 and max_size")
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._health_check = health_check
+        self._close = close
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()            # (resource, released_at)
+        self._async_waiters = deque()   # (loop, future)
+        self._size = 0                  # idle + in use + being created
+        self._in_use = 0
+        self._lent = {}                 # id(resource) -> resource, checked out
+        self._last_change = time.perf_counter()
+        self._closed = False
+        self.metrics = PoolMetrics()
+
+        if prefill and not inspect.iscoroutinefunction(factory):
+            for _ in range(min_size):
+                with self._lock:
+                    self._size += 1
+                self._put_idle(self._create())
+
+    # -- public API ---------------------------------------------------------
+
+    def resource(self, timeout=None):
+        """Return a context manager lending one resource"""
+        return PooledResource(self, timeout)
+
+    def acquire(self, timeout=None):
+        """Check out a resource, blocking at most `timeout` seconds"""
+        if inspect.iscoroutinefunction(self._health_check):
+            raise TypeError("async health checks need acquire_async")
+        self.evict_idle()
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+        while True:
+            with self._lock:
+                while True:
+                    action, item = self._checkout_locked()
+                    if action is not None:
+                        break
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        self.metrics.timeouts += 1
+                        raise PoolTimeout(f"no resource available within {timeout} s")
+                    self._available.wait(remaining)
+
+            resource = self._finish_checkout(action, item)
+            if resource is not None:
+                with self._lock:
+                    self.metrics.record_wait(time.perf_counter() - start)
+                return resource
+
+    async def acquire_async(self, timeout=None):
+        """Check out a resource without blocking the event loop"""
+        self.evict_idle()
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+        while True:
+            with self._lock:
+                action, item = self._checkout_locked()
+                if action is None:
+                    waiter = (loop, loop.create_future())
+                    self._async_waiters.append(waiter)
+            if action is None:
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                try:
+                    if remaining is not None and remaining <= 0:
+                        raise asyncio.TimeoutError
+                    await asyncio.wait_for(asyncio.shield(waiter[1]), remaining)
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self._remove_waiter(waiter)
+                        self.metrics.timeouts += 1
+                    raise PoolTimeout(f"no resource available within {timeout} s") from None
+                except asyncio.CancelledError:
+                    with self._lock:
+                        self._remove_waiter(waiter)
+                    raise
+                continue
+
+            resource = await self._finish_checkout_async(action, item)
+            if resource is not None:
+                with self._lock:
+                    self.metrics.record_wait(time.perf_counter() - start)
+                return resource
+
+    def release(self, resource, discard=False):
+        """Give a resource back to the pool (or dispose of it)"""
+        if self._release(resource, discard):
+            self._refill()
+        self.evict_idle()
+
+    async def release_async(self, resource, discard=False):
+        """Asynchronous counterpart of release"""
+        if self._release(resource, discard):
+            await self._refill_async()
+        self.evict_idle()
+
+    def evict_idle(self):
+        """Close resources idle longer than max_idle, keeping min_size alive"""
+        if self.max_idle is None:
+            return 0
+        expired = []
+        now = time.perf_counter()
+        with self._lock:
+            # idle resources are appended on release, so the oldest are left
+            while (self._idle and self._size > self.min_size
+                   and now - self._idle[0][1] > self.max_idle):
+                expired.append(self._idle.popleft()[0])
+                self._size -= 1
+            self.metrics.evicted += len(expired)
+        for resource in expired:
+            self._destroy(resource)
+        return len(expired)
+
+    def close(self):
+        """Close all idle resources; resources in use are closed on release"""
+        with self._lock:
+            self._closed = True
+            idle = [resource for resource, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._available.notify_all()
+            while self._async_waiters:
+                self._wake_one()
+        for resource in idle:
+            self._destroy(resource)
+
+    def stats(self):
+        """Return a snapshot of the pool state and its metrics"""
+        with self._lock:
+            self._track_usage(0)
+            elapsed = time.perf_counter() - self.metrics._started
+            m = self.metrics
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': len(self._async_waiters),
+                'checkouts': m.checkouts,
+                'timeouts': m.timeouts,
+                'created': m.created,
+                'destroyed': m.destroyed,
+                'evicted': m.evicted,
+                'failed_health_checks': m.failed_health_checks,
+                'mean_wait': m.mean_wait,
+                'max_wait': m.max_wait,
+                'utilization': m._busy_area / (self.max_size * elapsed) if elapsed else 0.0,
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # -- internals ----------------------------------------------------------
+
+    def _checkout_locked(self):
+        """
+        Decide how to serve a checkout while holding the lock.
+        Returns ('idle', resource), ('create', None) or (None, None) to wait.
+        """
+        if self._closed:
+            raise PoolClosed("pool is closed")
+        if self._idle:
+            resource, _ = self._idle.pop()      # most recently used first
+            self._track_usage(+1)
+            return 'idle', resource
+        if self._size < self.max_size:
+            # reserve the slot, the resource itself is created unlocked
+            self._size += 1
+            self._track_usage(+1)
+            return 'create', None
+        return None, None
+
+    def _finish_checkout(self, action, item):
+        """Create or health check outside the lock; None means retry"""
+        if action == 'create':
+            try:
+                return self._lend(self._create())
+            except BaseException:
+                self._give_up_slot()
+                raise
+        try:
+            healthy = self._check(item)
+        except BaseException:
+            self._discard(item)
+            self._refill()
+            raise
+        if healthy:
+            return self._lend(item)
+        self._discard(item)
+        self._refill()
+        return None
+
+    async def _finish_checkout_async(self, action, item):
+        if action == 'create':
+            try:
+                return self._lend(await _maybe_await(self._create()))
+            except BaseException:
+                self._give_up_slot()
+                raise
+        try:
+            healthy = await self._check_async(item)
+        except BaseException:
+            self._discard(item)
+            raise
+        if healthy:
+            return self._lend(item)
+        self._discard(item)
+        await self._refill_async()
+        return None
+
+    def _lend(self, resource):
+        with self._lock:
+            self._lent[id(resource)] = resource
+        return resource
+
+    def _release(self, resource, discard):
+        """Return a lent resource; True if it was discarded"""
+        with self._lock:
+            if self._lent.get(id(resource), _NOT_LENT) is not resource:
+                raise ValueError("resource is not checked out from this pool, "
+                                 "or was released already")
+            del self._lent[id(resource)]
+            self._track_usage(-1)
+            discard = discard or self._closed
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((resource, time.perf_counter()))
+                self._wake_one()
+        if discard:
+            self._destroy(resource)
+            with self._lock:
+                self._wake_one()
+        return discard
+
+    def _give_up_slot(self):
+        with self._lock:
+            self._size -= 1
+            self._track_usage(-1)
+            self._wake_one()
+
+    def _discard(self, resource):
+        """Drop a checked out resource which failed its health check"""
+        self._give_up_slot()
+        self._destroy(resource)
+
+    def _reserve_missing(self):
+        """Reserve the slots needed to get back to min_size (locked)"""
+        missing = 0 if self._closed else max(self.min_size - self._size, 0)
+        self._size += missing
+        return missing
+
+    def _refill(self):
+        """Replace discarded resources while the pool is below min_size"""
+        if inspect.iscoroutinefunction(self._factory):
+            # the next acquire_async creates them
+            return
+        with self._lock:
+            missing = self._reserve_missing()
+        for _ in range(missing):
+            try:
+                resource = self._create()
+            except Exception:
+                # created on demand later
+                self._drop_reservation()
+            else:
+                self._put_idle(resource)
+
+    async def _refill_async(self):
+        with self._lock:
+            missing = self._reserve_missing()
+        for _ in range(missing):
+            try:
+                resource = await _maybe_await(self._create())
+            except Exception:
+                self._drop_reservation()
+            else:
+                self._put_idle(resource)
+
+    def _drop_reservation(self):
+        with self._lock:
+            self._size -= 1
+            self._wake_one()
+
+    def _create(self):
+        resource = self._factory()
+        with self._lock:
+            self.metrics.created += 1
+        return resource
+
+    def _put_idle(self, resource):
+        with self._lock:
+            closed = self._closed
+            if closed:
+                # created while the pool was closed
+                self._size -= 1
+            else:
+                self._idle.append((resource, time.perf_counter()))
+                self._wake_one()
+        if closed:
+            self._destroy(resource)
+
+    def _check(self, resource):
+        if self._health_check is None:
+            return True
+        try:
+            healthy = self._health_check(resource)
+        except Exception:
+            healthy = False
+        if inspect.isawaitable(healthy):
+            healthy.close()
+            raise TypeError("async health checks need acquire_async")
+        if not healthy:
+            with self._lock:
+                self.metrics.failed_health_checks += 1
+        return bool(healthy)
+
+    async def _check_async(self, resource):
+        if self._health_check is None:
+            return True
+        try:
+            healthy = await _maybe_await(self._health_check(resource))
+        except Exception:
+            healthy = False
+        if not healthy:
+            with self._lock:
+                self.metrics.failed_health_checks += 1
+        return bool(healthy)
+
+    def _destroy(self, resource):
+        with self._lock:
+            self.metrics.destroyed += 1
+        if self._close is not None:
+            try:
+                self._close(resource)
+            except Exception:
+                # a resource which fails to close is gone anyway
+                pass
+
+    def _track_usage(self, delta):
+        """Update the in-use count and the utilization integral (locked)"""
+        now = time.perf_counter()
+        self.metrics._busy_area += self._in_use * (now - self._last_change)
+        self._last_change = now
+        self._in_use += delta
+
+    def _wake_one(self):
+        """Wake one thread and one coroutine waiting for a resource (locked)"""
+        self._available.notify()
+        while self._async_waiters:
+            loop, future = self._async_waiters.popleft()
+            if not future.done():
+                loop.call_soon_threadsafe(_set_if_pending, future)
+                break
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._async_waiters.remove(waiter)
+        except ValueError:
+            # already woken up, pass the wake up on to the next waiter
+            self._wake_one()
+
+
+_NOT_LENT = object()
+
+
+def _set_if_pending(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+# Using the pool instead of one ResourceManager per call
+_processor_pool = ResourcePool(lambda: object(), min_size=1, max_size=4)
+
+
+def process_data(data):
+    # like ResourceManager.__exit__ in the notebook, a ValueError ends the call with None
+    with contextlib.suppress(ValueError), _processor_pool.resource():
+        if not data:
+            raise ValueError("Empty data")
+        return [x * 2 for x in data]
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ThreadPoolExecutor
+
+    def slow_connection():
+        time.sleep(0.01)    # simulate an expensive connect
+        return {'open': True}
+
+    def benchmark(function, function_name):
+        start = time.perf_counter()
+        function()
+        end = time.perf_counter()
+        print("{0:.4f} seconds for {1}".format(end - start, function_name))
+
+    def acquire_per_call(n=200):
+        for _ in range(n):
+            resource = slow_connection()
+            resource['open'] = False
+
+    pool = ResourcePool(slow_connection, min_size=2, max_size=8,
+                        health_check=lambda r: r['open'],
+                        close=lambda r: r.update(open=False))
+
+    def pooled(n=200):
+        for _ in range(n):
+            with pool.resource():
+                pass
+
+    benchmark(acquire_per_call, "acquire per call")
+    benchmark(pooled, "pooled")
+
+    # many threads share at most max_size resources
+    with ThreadPoolExecutor(32) as executor:
+        list(executor.map(lambda _: pooled(10), range(32)))
+
+    async def worker():
+        async with pool.resource() as conn:
+            await asyncio.sleep(0.001)
+            return conn['open']
+
+    async def run_async():
+        return await asyncio.gather(*(worker() for _ in range(100)))
+
+    print("async workers ok:", all(asyncio.run(run_async())))
+    print(process_data([1, 2, 3, 4]))
+    assert process_data([]) is None
+    print(pool.stats())
+    pool.close()
+
+    async def idle_async_pool():
+        # only the async API: idle resources still expire
+        pool = ResourcePool(lambda: object(), max_size=4, max_idle=0.01)
+        async with pool.resource(), pool.resource():
+            pass
+        await asyncio.sleep(0.02)
+        async with pool.resource():
+            pass
+        return pool.stats()
+    assert asyncio.run(idle_async_pool())['evicted'] == 2
+
+    # misuse must not wedge or corrupt the pool
+    async def async_check(resource):
+        return True
+    strict = ResourcePool(lambda: object(), max_size=1, health_check=async_check)
+    try:
+        strict.acquire()
+    except TypeError:
+        pass
+    assert strict.stats()['size'] == 0 and strict.stats()['in_use'] == 0
+    strict.close()
+
+    healthy = [False] * 3
+    refilled = ResourcePool(lambda: object(), min_size=3, max_size=5,
+                            health_check=lambda r: healthy.pop() if healthy else True)
+    with refilled.resource():
+        pass
+    assert refilled.stats()['size'] == 3 and refilled.stats()['failed_health_checks'] == 3
+    resource = refilled.acquire()
+    refilled.release(resource)
+    try:
+        refilled.release(resource)
+    except ValueError:
+        pass
+    assert refilled.stats()['idle'] == 3 and refilled.stats()['in_use'] == 0
+    refilled.close()
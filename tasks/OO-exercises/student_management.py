@@ -0,0 +1,323 @@
+"""
+Student Management System
+
+Runnable version of the project in oop-notebook_project.py, so that other
+modules can import the classes.
+
+Low cardinality strings (program of a student, course codes, department
+names) are interned with sys.intern: thousands of students of the same
+program then share one string object, also when the data is loaded back
+from JSON (see code/ntbks/01_intro/interning.py).
+"""
+from abc import ABC, abstractmethod
+import json
+import sys
+import uuid
+
+
+class Identifiable:
+    """Mixin for generating unique identifiers"""
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+
+
+class Serializable:
+    """Mixin for JSON serialization"""
+    # string attributes shared by many instances, interned on load
+    interned_fields = ()
+
+    def to_dict(self):
+        # referenced entities (courses of a student, students of a course)
+        # are stored by id, the objects point at each other and are not JSON
+        data = {}
+        for key, value in self.__dict__.items():
+            if key.startswith('_'):
+                # runtime state such as listeners
+                continue
+            if isinstance(value, list):
+                value = [v.id if isinstance(v, Identifiable) else v for v in value]
+            data[key] = value
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        instance = cls()
+        instance.__dict__.update(data)
+        for field in cls.interned_fields:
+            value = instance.__dict__.get(field)
+            if isinstance(value, str):
+                instance.__dict__[field] = sys.intern(value)
+        return instance
+
+
+class Observable:
+    """Mixin for change listeners, called as listener(source, event, *args)"""
+    def add_listener(self, listener):
+        self.__dict__.setdefault('_listeners', []).append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, event, *args):
+        for listener in self.__dict__.get('_listeners', ()):
+            listener(self, event, *args)
+
+
+class AcademicEntity(ABC, Identifiable, Serializable, Observable):
+    """Abstract base class for academic entities"""
+    @abstractmethod
+    def validate(self):
+        """Validate the entity's data"""
+        pass
+
+    @abstractmethod
+    def display_info(self):
+        """Display entity information"""
+        pass
+
+
+class Student(AcademicEntity):
+    interned_fields = ('program',)
+
+    def __init__(self, 
+                 name: str = '', 
+                 age: int = 0, 
+                 email: str = '', 
+                 program: str = ''):
+        super().__init__()
+        self.name = name
+        self.age = age
+        self.email = email
+        self.program = sys.intern(program)
+        self.courses = []
+        self.grades = {}
+    
+    def validate(self):
+        """Comprehensive data validation"""
+        if not self.name or len(self.name) < 2:
+            raise ValueError("Invalid name")
+        if not 16 <= self.age <= 100:
+            raise ValueError("Invalid age")
+        if '@' not in self.email:
+            raise ValueError("Invalid email")
+    
+    def enroll(self, course):
+        """Enroll in a course"""
+        if course not in self.courses:
+            self.courses.append(course)
+    
+    def add_grade(self, course, grade):
+        """Add grade for a specific course"""
+        if 0 <= grade <= 100:
+            previous = self.grades.get(course.code)
+            self.grades[course.code] = grade
+            self._notify('grade', course, previous, grade)
+        else:
+            raise ValueError("Invalid grade")
+    
+    def calculate_gpa(self):
+        """Calculate student's GPA"""
+        if not self.grades:
+            return 0.0
+        
+        def grade_to_point(grade):
+            if grade >= 90: return 4.0
+            if grade >= 80: return 3.0
+            if grade >= 70: return 2.0
+            if grade >= 60: return 1.0
+            return 0.0
+        
+        grade_points = [grade_to_point(g) for g in self.grades.values()]
+        return sum(grade_points) / len(grade_points)
+    
+    def display_info(self):
+        """Display comprehensive student information"""
+        return (f"Student: {self.name}\n"
+                f"ID: {self.id}\n"
+                f"Program: {self.program}\n"
+                f"Courses: {len(self.courses)}\n"
+                f"GPA: {self.calculate_gpa():.2f}")
+
+
+class Course(AcademicEntity):
+    interned_fields = ('code',)
+
+    def __init__(self, 
+                 code: str = '', 
+                 name: str = '', 
+                 credits: int = 0):
+        super().__init__()
+        self.code = sys.intern(code)
+        self.name = name
+        self.credits = credits
+        self.enrolled_students = []
+    
+    def validate(self):
+        if not self.code or len(self.code) < 3:
+            raise ValueError("Invalid course code")
+        if self.credits < 0 or self.credits > 6:
+            raise ValueError("Invalid credits")
+    
+    def enroll_student(self, student):
+        """Enroll a student in the course"""
+        if student not in self.enrolled_students:
+            self.enrolled_students.append(student)
+            student.enroll(self)
+    
+    def display_info(self):
+        return (f"Course: {self.name}\n"
+                f"Code: {self.code}\n"
+                f"Credits: {self.credits}\n"
+                f"Enrolled Students: {len(self.enrolled_students)}")
+
+
+class Department(AcademicEntity):
+    interned_fields = ('name',)
+
+    def __init__(self, name: str = '', head: str = ''):
+        super().__init__()
+        self.name = sys.intern(name)
+        self.head = head
+        self.courses = []
+        self.students = []
+    
+    def validate(self):
+        if not self.name:
+            raise ValueError("Department name required")
+    
+    def add_course(self, course):
+        """Add a course to the department"""
+        if course not in self.courses:
+            self.courses.append(course)
+    
+    def add_student(self, student):
+        """Add a student to the department"""
+        if student not in self.students:
+            self.students.append(student)
+            self._notify('student', student)
+    
+    def display_info(self):
+        return (f"Department: {self.name}\n"
+                f"Head: {self.head}\n"
+                f"Courses: {len(self.courses)}\n"
+                f"Students: {len(self.students)}")
+
+
+class AcademicManagementSystem(Observable):
+    def __init__(self):
+        self.students = []
+        self.courses = []
+        self.departments = []
+    
+    def register_student(self, student):
+        """Register a new student"""
+        student.validate()
+        self.students.append(student)
+        self._notify('student', student)
+        return student
+    
+    def create_course(self, course, department=None):
+        """Create and register a course"""
+        course.validate()
+        self.courses.append(course)
+        
+        if department:
+            department.add_course(course)
+        
+        return course
+    
+    def create_department(self, department):
+        """Create and register a department"""
+        department.validate()
+        self.departments.append(department)
+        self._notify('department', department)
+        return department
+    
+    def save_data(self, filename='academic_data.json'):
+        """Save system data to JSON"""
+        data = {
+            'students': [student.to_dict() for student in self.students],
+            'courses': [course.to_dict() for course in self.courses],
+            'departments': [dept.to_dict() for dept in self.departments]
+        }
+        
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=4)
+    
+    def load_data(self, filename='academic_data.json'):
+        """Load system data from JSON"""
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        
+        self.students = [Student.from_dict(s) for s in data['students']]
+        self.courses = [Course.from_dict(c) for c in data['courses']]
+        self.departments = [Department.from_dict(d) for d in data['departments']]
+
+        # to_dict stored the references by id, point them at the objects again
+        students = {student.id: student for student in self.students}
+        courses = {course.id: course for course in self.courses}
+        for student in self.students:
+            student.courses = _resolve(student.courses, courses, 'course')
+        for course in self.courses:
+            course.enrolled_students = _resolve(course.enrolled_students, students, 'student')
+        for dept in self.departments:
+            dept.courses = _resolve(dept.courses, courses, 'course')
+            dept.students = _resolve(dept.students, students, 'student')
+
+
+def _resolve(ids, entities, kind):
+    """The entities with the given ids"""
+    try:
+        return [entities[i] for i in ids]
+    except KeyError as error:
+        raise ValueError(f"unknown {kind} id {error.args[0]}") from None
+
+
+def main():
+    # Create management system
+    ams = AcademicManagementSystem()
+    
+    # Create departments
+    cs_dept = ams.create_department(Department("Computer Science", "Dr. Smith"))
+    math_dept = ams.create_department(Department("Mathematics", "Dr. Johnson"))
+    
+    # Create courses
+    python_course = ams.create_course(Course("CS101", "Intro to Python", 3), cs_dept)
+    data_structures = ams.create_course(Course("CS201", "Data Structures", 4), cs_dept)
+    calculus = ams.create_course(Course("MATH101", "Calculus I", 4), math_dept)
+    
+    # Create students
+    alice = ams.register_student(Student("Alice", 20, "alice@example.com", "Computer Science"))
+    bob = ams.register_student(Student("Bob", 22, "bob@example.com", "Mathematics"))
+    
+    # Enroll students in courses
+    python_course.enroll_student(alice)
+    data_structures.enroll_student(alice)
+    calculus.enroll_student(bob)
+    
+    # Add grades
+    alice.add_grade(python_course, 85)
+    alice.add_grade(data_structures, 92)
+    bob.add_grade(calculus, 78)
+    
+    # Display information
+    print("Academic Management System Demo:")
+    print("\nDepartments:")
+    for dept in ams.departments:
+        print(dept.display_info())
+    
+    print("\nStudents:")
+    for student in ams.students:
+        print(student.display_info())
+    
+    # Save and load demonstration
+    ams.save_data()
+    print("\nData saved successfully!")
+
+    loaded = AcademicManagementSystem()
+    loaded.load_data()
+    print(loaded.students[0].display_info())
+
+
+if __name__ == "__main__":
+    main()